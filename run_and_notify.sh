@@ -1,42 +1,59 @@
 #!/bin/bash
 
 # Paths
-SOURCE="/var/www/DataScraper/data/daily/"
-RCLONE="/usr/bin/rclone"
-CONFIG="/home/ubuntu/.config/rclone/rclone.conf"
-REMOTE="scraper:daily-backup"
+APP_DIR="/var/www/DataScraper"
+SOURCE="$APP_DIR/data/daily/"
+PYTHON="${PYTHON:-python3}"
+
+# Backup destination and rclone settings (read by src/backup.py)
+export BACKUP_REMOTE="${BACKUP_REMOTE:-rclone:scraper:daily-backup}"
+export RCLONE_BIN="${RCLONE_BIN:-/usr/bin/rclone}"
+export RCLONE_CONFIG="${RCLONE_CONFIG:-/home/ubuntu/.config/rclone/rclone.conf}"
+
+# Alert credentials (TWILIO_*, ALERT_*) come from the environment; optionally load them from a file
+ENV_FILE="${DATASCRAPER_ENV_FILE:-$APP_DIR/.env}"
+if [ -f "$ENV_FILE" ]; then
+    set -a
+    . "$ENV_FILE"
+    set +a
+fi
+
+notify() {
+    (cd "$APP_DIR" && "$PYTHON" -m src.alerts "$1")
+}
+
+# Close bars left open by the day's last scraper tick (the 15:30 tick normally does this)
+if [ "${WRITE_BARS:-true}" != "false" ]; then
+    BAR_ARGS=""
+    if [ -n "$DATABASE_URL" ]; then
+        BAR_ARGS="--write-db"
+    fi
+    if ! (cd "$APP_DIR" && "$PYTHON" -m src.bars flush $BAR_ARGS); then
+        notify "Bar flush FAILED. Please check the server."
+    fi
+fi
 
 # Check if CSV files exist
 FILES=$(ls $SOURCE/*.csv 2>/dev/null | wc -l)
 
 if [ "$FILES" -eq 0 ]; then
     # No CSV files found
-    curl -X POST https://api.twilio.com/2010-04-01/Accounts/AC67cffc84b0ffca0cb95e91604a4f13f8/Messages.json \
-        --data-urlencode "To=whatsapp:+919656554244" \
-        --data-urlencode "From=whatsapp:+14155238886" \
-        --data-urlencode "Body=No CSV files found. Nothing to upload." \
-        -u AC67cffc84b0ffca0cb95e91604a4f13f8:da74f025d5742ae039d8dcc532c5dff0
+    notify "No CSV files found. Nothing to upload."
     exit 0
 fi
 
-# Run rclone move
-sudo $RCLONE --config $CONFIG move "$SOURCE" "$REMOTE" \
-  --include "*.csv" --transfers=4 --checkers=8 --progress
-
+# Compress, checksum and upload closed CSVs (4 in parallel); files already in the
+# manifest are skipped and previous days' files are removed once uploaded.
+# During market hours the same command without --delete-source runs from cron (see
+# crontab) so each hourly segment is backed up soon after the scraper moves on.
+SUMMARY=$(cd "$APP_DIR" && "$PYTHON" -m src.backup --source "$SOURCE" --workers 4 --delete-source 2>&1)
 STATUS=$?
+echo "$SUMMARY"
 
 if [ $STATUS -eq 0 ]; then
     # Success
-    curl -X POST https://api.twilio.com/2010-04-01/Accounts/AC67cffc84b0ffca0cb95e91604a4f13f8/Messages.json \
-        --data-urlencode "To=whatsapp:+919656554244" \
-        --data-urlencode "From=whatsapp:+14155238886" \
-        --data-urlencode "Body=CSV files moved successfully to Google Drive." \
-        -u AC67cffc84b0ffca0cb95e91604a4f13f8:da74f025d5742ae039d8dcc532c5dff0
+    notify "CSV backup complete. $(echo "$SUMMARY" | tail -n 1)"
 else
     # Failed
-    curl -X POST https://api.twilio.com/2010-04-01/Accounts/AC67cffc84b0ffca0cb95e91604a4f13f8/Messages.json \
-        --data-urlencode "To=whatsapp:+919656554244" \
-        --data-urlencode "From=whatsapp:+14155238886" \
-        --data-urlencode "Body=Rclone upload FAILED. Please check the server." \
-        -u AC67cffc84b0ffca0cb95e91604a4f13f8:da74f025d5742ae039d8dcc532c5dff0
+    notify "CSV backup FAILED. $(echo "$SUMMARY" | tail -n 1) Please check the server."
 fi
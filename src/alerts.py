@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+import pytz
+import requests
+
+# Make sure src is on PYTHONPATH for relative imports when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Seconds between two deliveries for the same error type; alerts in between are counted
+# and reported in the next message instead of being sent individually
+DEFAULT_RATE_LIMIT_SECONDS = 900
+# Seconds the worker keeps collecting after the first alert so bursts go out as one digest
+DEFAULT_DIGEST_WINDOW_SECONDS = 5
+# Max seconds to wait at shutdown for queued alerts to be delivered
+DEFAULT_FLUSH_TIMEOUT_SECONDS = 30
+# Rate-limit state survives across runs (the scraper is a fresh process per cron tick)
+DEFAULT_STATE_FILE = os.path.join('data', '.alert_state.json')
+MAX_QUEUED_ALERTS = 1000
+
+
+def _now_ist() -> str:
+    return datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d %H:%M:%S IST')
+
+
+# ---------- Backends ----------
+class TwilioWhatsAppBackend:
+    """Deliver alerts as WhatsApp messages through the Twilio API."""
+    name = 'twilio'
+
+    def __init__(self, account_sid: str, auth_token: str, to: str, from_: str, timeout: float = 10):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.to = to
+        self.from_ = from_
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> Optional['TwilioWhatsAppBackend']:
+        """
+        Build from TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_TO and
+        TWILIO_WHATSAPP_FROM. Returns None if any of them is missing.
+        """
+        values = [os.environ.get(k) for k in
+                  ('TWILIO_ACCOUNT_SID', 'TWILIO_AUTH_TOKEN', 'TWILIO_WHATSAPP_TO', 'TWILIO_WHATSAPP_FROM')]
+        if not all(values):
+            return None
+        return cls(*values)
+
+    def send(self, message: str) -> None:
+        url = f"https://api.twilio.com/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+        response = requests.post(
+            url,
+            data={'To': self.to, 'From': self.from_, 'Body': message},
+            auth=(self.account_sid, self.auth_token),
+            timeout=self.timeout
+        )
+        if not response.ok:
+            raise RuntimeError(f"Twilio HTTP {response.status_code}: {response.text[:500]}")
+
+
+class WebhookBackend:
+    """POST alerts as JSON ({"text": message}) to a webhook, e.g. Slack or a custom endpoint."""
+    name = 'webhook'
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls) -> Optional['WebhookBackend']:
+        url = os.environ.get('ALERT_WEBHOOK_URL')
+        return cls(url) if url else None
+
+    def send(self, message: str) -> None:
+        response = requests.post(self.url, json={'text': message}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class FileBackend:
+    """Append alerts to a local file; useful for testing and as an audit trail."""
+    name = 'file'
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def from_env(cls) -> 'FileBackend':
+        return cls(os.environ.get('ALERT_FILE_PATH', os.path.join('data', 'alerts.log')))
+
+    def send(self, message: str) -> None:
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"----- {_now_ist()}\n{message}\n")
+
+
+BACKENDS = {
+    TwilioWhatsAppBackend.name: TwilioWhatsAppBackend,
+    WebhookBackend.name: WebhookBackend,
+    FileBackend.name: FileBackend,
+}
+
+
+def backends_from_env() -> list:
+    """
+    Build the backends listed in ALERT_BACKENDS (comma-separated, default: twilio).
+    Backends whose configuration is missing are skipped with a warning.
+    """
+    names = [n.strip().lower() for n in os.environ.get('ALERT_BACKENDS', 'twilio').split(',') if n.strip()]
+    backends = []
+    for name in names:
+        backend_cls = BACKENDS.get(name)
+        if backend_cls is None:
+            print(f"Unknown alert backend '{name}'. Known: {', '.join(BACKENDS)}")
+            continue
+        backend = backend_cls.from_env()
+        if backend is None:
+            print(f"Alert backend '{name}' is not configured (missing environment variables). Skipping.")
+            continue
+        backends.append(backend)
+    return backends
+
+
+def deliver(backends: list, message: str) -> bool:
+    """Send `message` to every backend. Returns True if at least one delivery succeeded."""
+    delivered = False
+    for backend in backends:
+        try:
+            backend.send(message)
+            delivered = True
+            print(f"✅ Alert delivered via {backend.name}")
+        except Exception as e:
+            # Don't raise - notification failures shouldn't break the scraper
+            print(f"❌ Failed to deliver alert via {backend.name}: {e}")
+    return delivered
+
+
+# ---------- Message formatting ----------
+def format_alert(error_type: str, error_message: str, context: Optional[str] = None,
+                 timestamp: Optional[str] = None) -> str:
+    """Format a single error alert."""
+    msg_parts = [
+        "🚨 DataScraper Error",
+        f"Time: {timestamp or _now_ist()}",
+        f"Type: {error_type}"
+    ]
+    if context:
+        msg_parts.append(f"Context: {context}")
+    msg_parts.append(f"Error: {error_message}")
+    return "\n".join(msg_parts)
+
+
+def format_digest(groups: list) -> str:
+    """
+    Format several alert groups into one message. Each group is a dict with
+    error_type, error_message, contexts, count and suppressed (alerts held back by
+    the rate limit since the last delivery for that type). Groups sharing an error
+    type but with different messages are listed separately.
+    """
+    total = sum(g['count'] + g['suppressed'] for g in groups)
+    msg_parts = [f"🚨 DataScraper Error Digest ({total} alerts)", f"Time: {_now_ist()}"]
+    for g in groups:
+        msg_parts.append("")
+        msg_parts.append(f"Type: {g['error_type']} (x{g['count']})")
+        if g['suppressed']:
+            msg_parts.append(f"Suppressed since last alert: {g['suppressed']}")
+        if g['contexts']:
+            msg_parts.append(f"Context: {'; '.join(g['contexts'])}")
+        msg_parts.append(f"Error: {g['error_message']}")
+    return "\n".join(msg_parts)
+
+
+# ---------- Dispatcher ----------
+class AlertDispatcher:
+    """
+    Deliver alerts from a background worker so callers never block on a backend.
+
+    notify() only enqueues. The worker waits `digest_window` seconds after the first
+    alert of a burst, then collapses alerts with the same error type and message
+    (merging their contexts). Error types already delivered within `rate_limit`
+    seconds are counted but held back (persisted in `state_file` so the limit holds
+    across cron runs). What remains goes out as a single message, or as a digest when
+    several alerts are involved.
+    """
+
+    def __init__(self, backends: List[object], rate_limit: float = DEFAULT_RATE_LIMIT_SECONDS,
+                 digest_window: float = DEFAULT_DIGEST_WINDOW_SECONDS,
+                 state_file: Optional[str] = DEFAULT_STATE_FILE):
+        self.backends = backends
+        self.rate_limit = rate_limit
+        self.digest_window = digest_window
+        self.state_file = state_file
+        # Rate-limit state when state_file is None
+        self._memory_state = {}
+        self._queue = queue.Queue(maxsize=MAX_QUEUED_ALERTS)
+        self._closing = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_env(cls) -> 'AlertDispatcher':
+        """
+        Configure from ALERT_BACKENDS (see backends_from_env), ALERT_RATE_LIMIT_SECONDS,
+        ALERT_DIGEST_WINDOW_SECONDS and ALERT_STATE_FILE.
+        """
+        return cls(
+            backends_from_env(),
+            rate_limit=float(os.environ.get('ALERT_RATE_LIMIT_SECONDS', DEFAULT_RATE_LIMIT_SECONDS)),
+            digest_window=float(os.environ.get('ALERT_DIGEST_WINDOW_SECONDS', DEFAULT_DIGEST_WINDOW_SECONDS)),
+            state_file=os.environ.get('ALERT_STATE_FILE', DEFAULT_STATE_FILE),
+        )
+
+    def notify(self, error_type: str, error_message: str, context: Optional[str] = None) -> None:
+        """Queue an alert. Never blocks; drops the alert if the queue is full or closed."""
+        if self._closing.is_set():
+            print(f"Alert dispatcher closed; dropping alert: {error_type}")
+            return
+        try:
+            self._queue.put_nowait((time.time(), error_type, error_message, context))
+        except queue.Full:
+            print(f"Alert queue full; dropping alert: {error_type}")
+
+    def close(self, timeout: float = DEFAULT_FLUSH_TIMEOUT_SECONDS) -> None:
+        """Flush queued alerts without waiting for the digest window, then stop the worker."""
+        if self._closing.is_set():
+            return
+        self._closing.set()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            print(f"Alert dispatcher did not finish within {timeout}s; pending alerts may be lost.")
+
+    # -- worker --
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._closing.is_set():
+                    return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.digest_window
+            while not self._closing.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+                except queue.Empty:
+                    pass
+            batch.extend(self._drain())
+            try:
+                self._process(batch)
+            except Exception as e:
+                print(f"❌ Alert dispatcher error: {e}")
+
+    def _drain(self) -> list:
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _process(self, batch: list) -> None:
+        state = self._load_state()
+        groups = OrderedDict()
+        for queued_at, error_type, error_message, context in batch:
+            g = groups.setdefault((error_type, error_message), {
+                'error_type': error_type, 'error_message': error_message,
+                'contexts': [], 'count': 0, 'suppressed': 0, 'first_at': queued_at,
+            })
+            g['count'] += 1
+            if context and context not in g['contexts']:
+                g['contexts'].append(context)
+
+        # Rate limiting is per error type, across all of that type's messages
+        by_type = OrderedDict()
+        for g in groups.values():
+            by_type.setdefault(g['error_type'], []).append(g)
+
+        now = time.time()
+        to_send = []
+        for error_type, type_groups in by_type.items():
+            entry = state.setdefault(error_type, {'last_sent': 0, 'suppressed': 0})
+            if now - entry['last_sent'] < self.rate_limit:
+                entry['suppressed'] += sum(g['count'] for g in type_groups)
+                print(f"Alert '{error_type}' rate-limited ({entry['suppressed']} suppressed since last delivery)")
+                continue
+            # Report the type's suppressed count once, on its first group
+            type_groups[0]['suppressed'] = entry['suppressed']
+            to_send.extend(type_groups)
+
+        if to_send:
+            if len(to_send) == 1 and to_send[0]['count'] == 1 and not to_send[0]['suppressed']:
+                g = to_send[0]
+                when = datetime.fromtimestamp(g['first_at'], pytz.timezone('Asia/Kolkata'))
+                message = format_alert(g['error_type'], g['error_message'],
+                                       g['contexts'][0] if g['contexts'] else None,
+                                       when.strftime('%Y-%m-%d %H:%M:%S IST'))
+            else:
+                message = format_digest(to_send)
+            if deliver(self.backends, message):
+                for g in to_send:
+                    state[g['error_type']] = {'last_sent': now, 'suppressed': 0}
+        self._save_state(state)
+
+    def _load_state(self) -> dict:
+        if not self.state_file:
+            return self._memory_state
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self, state: dict) -> None:
+        if not self.state_file:
+            self._memory_state = state
+            return
+        try:
+            parent = os.path.dirname(self.state_file)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            tmp_path = f"{self.state_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            print(f"Failed to save alert state: {e}")
+
+
+_dispatcher: Optional[AlertDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> AlertDispatcher:
+    """Return the process-wide dispatcher, creating it from env on first use. Flushed at exit."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AlertDispatcher.from_env()
+            atexit.register(_dispatcher.close)
+        return _dispatcher
+
+
+if __name__ == '__main__':
+    # Send a one-off message synchronously, e.g. from shell scripts:
+    #   python -m src.alerts "Backup finished"
+    if len(sys.argv) < 2:
+        print("Usage: python -m src.alerts <message>")
+        sys.exit(1)
+    backends = backends_from_env()
+    if not backends:
+        print("No alert backends configured.")
+        sys.exit(1)
+    sys.exit(0 if deliver(backends, " ".join(sys.argv[1:])) else 2)
@@ -0,0 +1,322 @@
+import os
+import sys
+import json
+import glob
+import gzip
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import List, Optional
+import pytz
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Make sure src is on PYTHONPATH for relative imports when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_SOURCES = [os.path.join('data', 'daily')]
+DEFAULT_MANIFEST = os.path.join('data', '.backup_manifest.json')
+DEFAULT_STAGING_DIR = os.path.join('data', '.backup_staging')
+# A file counts as closed once it hasn't been written for this long. The scraper writes
+# hourly segments (CSV_SEGMENT_MINUTES), so each one closes shortly after its hour ends.
+DEFAULT_QUIET_SECONDS = 300
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+# ---------- Remotes ----------
+class LocalDirRemote:
+    """Store backups in a local (or mounted) directory. Also the stand-in remote for tests."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def __str__(self):
+        return f"local:{self.root}"
+
+    def upload(self, local_path: str, remote_name: str) -> None:
+        dest = os.path.join(self.root, remote_name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Copy to a partial file first so an interrupted upload never looks complete
+        part = f"{dest}.part"
+        shutil.copyfile(local_path, part)
+        if os.path.getsize(part) != os.path.getsize(local_path):
+            raise IOError(f"Size mismatch after copying {local_path}")
+        os.replace(part, dest)
+
+
+class RcloneRemote:
+    """Upload through rclone to any configured rclone remote, e.g. 'scraper:daily-backup'."""
+
+    def __init__(self, remote: str, rclone: str = 'rclone', config: Optional[str] = None, timeout: float = 600):
+        self.remote = remote.rstrip('/')
+        self.rclone = rclone
+        self.config = config
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"rclone:{self.remote}"
+
+    def upload(self, local_path: str, remote_name: str) -> None:
+        cmd = [self.rclone]
+        if self.config:
+            cmd += ['--config', self.config]
+        # copyto skips the transfer when an identical object already exists remotely
+        cmd += ['copyto', local_path, f"{self.remote}/{remote_name}"]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=self.timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"rclone exited with {result.returncode}: {result.stderr.strip()[:500]}")
+
+
+def remote_from_spec(spec: str):
+    """
+    Build a remote from 'local:<dir>' or 'rclone:<remote:path>'.
+    rclone options come from RCLONE_BIN and RCLONE_CONFIG.
+    """
+    kind, _, target = spec.partition(':')
+    if kind == 'local' and target:
+        return LocalDirRemote(target)
+    if kind == 'rclone' and target:
+        return RcloneRemote(target, rclone=os.environ.get('RCLONE_BIN', 'rclone'),
+                            config=os.environ.get('RCLONE_CONFIG'))
+    raise ValueError(f"Invalid backup remote {spec!r}; expected 'local:<dir>' or 'rclone:<remote:path>'")
+
+
+# ---------- Manifest ----------
+class Manifest:
+    """
+    JSON record of uploaded files keyed by absolute source path. Saved after every upload
+    so an interrupted run resumes where it stopped; unchanged files are skipped on re-runs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            entries = {}
+        # Older manifests were keyed by the path as passed on the command line
+        self.entries = {os.path.abspath(key): entry for key, entry in entries.items()}
+
+    def is_current(self, path: str, stat: os.stat_result, remote) -> bool:
+        """True if `path` was uploaded to `remote` and hasn't changed since."""
+        entry = self.entries.get(os.path.abspath(path))
+        return (entry is not None and entry.get('remote') == str(remote)
+                and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns)
+
+    def record(self, path: str, entry: dict) -> None:
+        with self._lock:
+            self.entries[os.path.abspath(path)] = entry
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def lock_file_for(manifest_path: str) -> str:
+    return f"{manifest_path}.lock"
+
+
+class RunLock:
+    """
+    Exclusive flock on a file beside the manifest, held for a whole backup run so an
+    overlapping run (e.g. the segment cron and the nightly --delete-source run) waits
+    instead of sharing staging files and overwriting each other's manifest entries.
+    A no-op where fcntl is unavailable.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Another backup run holds {self.path}; waiting for it to finish...")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        return False
+
+
+# ---------- Pipeline ----------
+def find_closed_files(sources: List[str], quiet_seconds: float, pattern: str = '*.csv') -> List[str]:
+    """Files matching `pattern` in `sources` that haven't been modified for `quiet_seconds`."""
+    cutoff = time.time() - quiet_seconds
+    closed = []
+    for source in sources:
+        for path in sorted(glob.glob(os.path.join(source, pattern))):
+            if os.path.isfile(path) and os.path.getmtime(path) <= cutoff:
+                closed.append(path)
+    return closed
+
+
+def compress_and_checksum(src_path: str, dest_path: str) -> dict:
+    """
+    Gzip `src_path` to `dest_path` in one streaming pass, hashing the raw and the
+    compressed bytes along the way.
+    """
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    raw_hash = hashlib.sha256()
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as raw_dest:
+        # mtime=0 keeps the archive (and its checksum) reproducible for identical input
+        with gzip.GzipFile(filename=os.path.basename(src_path), mode='wb', fileobj=raw_dest, mtime=0) as gz:
+            while True:
+                block = src.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                raw_hash.update(block)
+                gz.write(block)
+    gz_hash = hashlib.sha256()
+    with open(dest_path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+            gz_hash.update(block)
+    return {'sha256': raw_hash.hexdigest(), 'gz_sha256': gz_hash.hexdigest(), 'gz_size': os.path.getsize(dest_path)}
+
+
+def backup_file(path: str, remote, manifest: Manifest, staging_dir: str,
+                retries: int = DEFAULT_RETRIES, backoff: float = 2) -> dict:
+    """Compress, checksum and upload one file, retrying the upload with exponential backoff."""
+    stat = os.stat(path)
+    source_dir = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    remote_name = f"{source_dir}/{os.path.basename(path)}.gz"
+    # Per-process name, so a run that bypasses the lock still can't clobber another's staged file
+    staged = os.path.join(staging_dir, f"{remote_name}.{os.getpid()}")
+    started = time.monotonic()
+    sums = compress_and_checksum(path, staged)
+    try:
+        for attempt in range(retries):
+            try:
+                remote.upload(staged, remote_name)
+                break
+            except Exception as e:
+                if attempt < retries - 1:
+                    print(f"Upload of {path} failed (attempt {attempt + 1}/{retries}): {e}. Retrying...")
+                    time.sleep(backoff ** attempt)
+                else:
+                    raise RuntimeError(f"Failed to upload {path} after {retries} attempts: {e}")
+    finally:
+        if os.path.exists(staged):
+            os.remove(staged)
+    entry = dict(sums, size=stat.st_size, mtime_ns=stat.st_mtime_ns, remote=str(remote), remote_name=remote_name,
+                 uploaded_at=datetime.now(pytz.timezone('Asia/Kolkata')).isoformat(),
+                 seconds=round(time.monotonic() - started, 3))
+    manifest.record(path, entry)
+    return entry
+
+
+def run_backup(sources: List[str], remote, manifest_path: str = DEFAULT_MANIFEST,
+               staging_dir: str = DEFAULT_STAGING_DIR, quiet_seconds: float = DEFAULT_QUIET_SECONDS,
+               workers: int = DEFAULT_WORKERS, retries: int = DEFAULT_RETRIES, delete_source: bool = False) -> dict:
+    """
+    Back up every closed file not already in the manifest, `workers` at a time.
+    With delete_source=True, every closed file whose manifest entry is current is
+    removed afterwards, whether it was uploaded in this run or an earlier one,
+    except files from today (IST) that the scraper may still append to.
+    Runs are serialised with a lock file beside the manifest.
+    Returns a summary with counts, byte totals, throughput and failures.
+    """
+    with RunLock(lock_file_for(manifest_path)):
+        return _run_backup(sources, remote, manifest_path, staging_dir, quiet_seconds, workers, retries,
+                           delete_source)
+
+
+def _run_backup(sources, remote, manifest_path, staging_dir, quiet_seconds, workers, retries, delete_source):
+    # Read the manifest under the lock so entries from the previous run are seen
+    manifest = Manifest(manifest_path)
+    candidates = find_closed_files(sources, quiet_seconds)
+    pending = [p for p in candidates if not manifest.is_current(p, os.stat(p), remote)]
+    skipped = [p for p in candidates if p not in pending]
+    print(f"Backup -> {remote}: {len(pending)} file(s) to upload, {len(skipped)} already backed up")
+
+    today_str = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d')
+    summary = {'uploaded': 0, 'skipped': len(skipped), 'failed': [], 'raw_bytes': 0, 'gz_bytes': 0, 'deleted': 0}
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(backup_file, p, remote, manifest, staging_dir, retries): p for p in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"❌ {path}: {e}")
+                summary['failed'].append((path, str(e)))
+                continue
+            summary['uploaded'] += 1
+            summary['raw_bytes'] += entry['size']
+            summary['gz_bytes'] += entry['gz_size']
+            ratio = entry['gz_size'] / entry['size'] if entry['size'] else 0
+            print(f"✅ {path} -> {entry['remote_name']} ({entry['size']} B -> {entry['gz_size']} B, "
+                  f"{ratio:.0%}, {entry['seconds']}s)")
+
+    if delete_source:
+        for path in candidates:
+            if today_str in os.path.basename(path) or not os.path.exists(path):
+                continue
+            if manifest.is_current(path, os.stat(path), remote):
+                os.remove(path)
+                summary['deleted'] += 1
+
+    summary['seconds'] = time.monotonic() - started
+    mb = summary['raw_bytes'] / (1024 * 1024)
+    summary['mb_per_s'] = mb / summary['seconds'] if summary['seconds'] > 0 else 0.0
+    print(f"Backup done: {summary['uploaded']} uploaded, {summary['skipped']} skipped, "
+          f"{len(summary['failed'])} failed, {summary['deleted']} deleted; "
+          f"{mb:.1f} MB raw -> {summary['gz_bytes'] / (1024 * 1024):.1f} MB compressed in "
+          f"{summary['seconds']:.1f}s ({summary['mb_per_s']:.2f} MB/s)")
+    return summary
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compress, checksum and upload closed data files.")
+    parser.add_argument("--source", action="append",
+                        help="Directory to back up (repeatable; default: data/daily)")
+    parser.add_argument("--remote", default=os.environ.get('BACKUP_REMOTE'),
+                        help="'local:<dir>' or 'rclone:<remote:path>' (default: BACKUP_REMOTE)")
+    parser.add_argument("--manifest", default=os.environ.get('BACKUP_MANIFEST', DEFAULT_MANIFEST))
+    parser.add_argument("--staging-dir", default=DEFAULT_STAGING_DIR)
+    parser.add_argument("--quiet-seconds", type=float,
+                        default=float(os.environ.get('BACKUP_QUIET_SECONDS', DEFAULT_QUIET_SECONDS)),
+                        help="Seconds without writes before a file counts as closed")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get('BACKUP_WORKERS', DEFAULT_WORKERS)))
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--delete-source", action="store_true",
+                        help="Remove backed-up files from previous days")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if not args.remote:
+        print("No backup remote. Pass --remote or set BACKUP_REMOTE.")
+        sys.exit(1)
+    result = run_backup(args.source or DEFAULT_SOURCES, remote_from_spec(args.remote), manifest_path=args.manifest,
+                        staging_dir=args.staging_dir, quiet_seconds=args.quiet_seconds, workers=args.workers,
+                        retries=args.retries, delete_source=args.delete_source)
+    sys.exit(2 if result['failed'] else 0)
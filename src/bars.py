@@ -0,0 +1,439 @@
+import os
+import sys
+import json
+import glob
+import argparse
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# Make sure src is on PYTHONPATH for relative imports when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db import get_engine, datetime_dtypes
+
+BARS_DIR = os.path.join('data', 'bars')
+DEFAULT_STATE_FILE = os.path.join(BARS_DIR, '.bar_state.json')
+DEFAULT_INTERVALS = '1min,5min'
+BAR_TABLE_PREFIX = 'option_bars_'
+
+BAR_COLUMNS = [
+    'bar_start', 'bar_end', 'symbol', 'underlying', 'option_type', 'strike', 'expiry',
+    'open', 'high', 'low', 'close', 'volume', 'vwap', 'oi_open', 'oi_close', 'oi_change', 'snapshots'
+]
+# Snapshot columns the aggregator reads
+SNAPSHOT_COLUMNS = [
+    'timestamp', 'server_timestamp', 'symbol', 'underlying', 'option_type', 'strike', 'expiry',
+    'last', 'volume', 'open_interest'
+]
+
+_UNITS = {'s': 1, 'sec': 1, 'min': 60, 'm': 60, 'h': 3600}
+
+
+def parse_interval(value: str) -> int:
+    """Parse an interval such as '30s', '1min', '5min' or '1h' into seconds."""
+    value = value.strip().lower()
+    digits = ''.join(ch for ch in value if ch.isdigit())
+    unit = value[len(digits):]
+    if not digits or unit not in _UNITS:
+        raise ValueError(f"Invalid bar interval: {value!r}")
+    seconds = int(digits) * _UNITS[unit]
+    if seconds <= 0 or 86400 % seconds:
+        raise ValueError(f"Bar interval must divide a day evenly: {value!r}")
+    return seconds
+
+
+def get_intervals() -> List[str]:
+    """Bar intervals from BAR_INTERVALS (comma-separated, default '1min,5min')."""
+    return [i.strip() for i in os.environ.get('BAR_INTERVALS', DEFAULT_INTERVALS).split(',') if i.strip()]
+
+
+def bar_start_for(ts: datetime, seconds: int) -> datetime:
+    """Start of the bar of length `seconds` containing `ts`, aligned to midnight."""
+    since_midnight = ts.hour * 3600 + ts.minute * 60 + ts.second
+    return ts.replace(microsecond=0) - timedelta(seconds=since_midnight % seconds)
+
+
+def _is_valid(x) -> bool:
+    return x is not None and x == x  # NaN != NaN
+
+
+def _to_datetime(value) -> Optional[datetime]:
+    if not _is_valid(value) or value == '':
+        return None
+    if isinstance(value, pd.Timestamp):
+        return None if pd.isna(value) else value.to_pydatetime()
+    if isinstance(value, datetime):
+        return value
+    ts = pd.to_datetime(value, errors='coerce')
+    return None if pd.isna(ts) else ts.to_pydatetime()
+
+
+class BarAggregator:
+    """
+    Incrementally aggregate option chain snapshots into per-contract bars.
+
+    Each bar holds OHLC of `last`, traded volume (delta of NSE's cumulative day volume),
+    a volume-weighted price of those deltas, and open interest at bar open/close plus
+    its change over the bar. Snapshots are bucketed by NSE's server timestamp (falling
+    back to the capture timestamp). A bar is closed once a snapshot from a later bucket
+    arrives; closed bars accumulate until save() writes them out.
+
+    Open bars, closed bars not yet written and the last seen volume/OI per contract
+    are kept in `state_file`, so
+    aggregation continues across separate scraper runs. Pass state_file=None for a
+    purely in-memory aggregator (e.g. backfills).
+    """
+
+    def __init__(self, intervals: Iterable[str], state_file: Optional[str] = DEFAULT_STATE_FILE):
+        self.intervals = {name: parse_interval(name) for name in intervals}
+        self.state_file = state_file
+        # contract -> {'date', 'volume', 'oi'}
+        self.last_seen = {}
+        # interval -> contract -> open bar dict
+        self.open_bars = {name: {} for name in self.intervals}
+        # interval -> list of closed bar dicts not yet written
+        self.closed_bars = {name: [] for name in self.intervals}
+        # underlying -> latest snapshot time seen
+        self.latest_ts = {}
+        if state_file:
+            self._load_state()
+
+    # -- aggregation --
+    def update(self, rows) -> None:
+        """Feed snapshot rows (a DataFrame or an iterable of row dicts), in time order per contract."""
+        if isinstance(rows, pd.DataFrame):
+            cols = [c for c in SNAPSHOT_COLUMNS if c in rows.columns]
+            frame = rows[cols].copy()
+            # Parse timestamps once per frame rather than per row (CSV history holds strings)
+            for col in ('timestamp', 'server_timestamp'):
+                if col in frame.columns:
+                    frame[col] = pd.to_datetime(frame[col], errors='coerce')
+            rows = (dict(zip(cols, values)) for values in frame.itertuples(index=False, name=None))
+        touched = set()
+        for row in rows:
+            touched.add(self._update_row(row))
+        # Rows arrive in time order per underlying, so any bar ending at or before the
+        # latest snapshot of its underlying can't receive more data
+        for underlying in touched:
+            if underlying in self.latest_ts:
+                self.close_due(self.latest_ts[underlying], underlying)
+
+    def _update_row(self, row: dict) -> Optional[str]:
+        """Apply one snapshot row; returns its underlying (None if the row was skipped)."""
+        ts = _to_datetime(row.get('server_timestamp')) or _to_datetime(row.get('timestamp'))
+        contract = row.get('symbol')
+        if ts is None or not contract:
+            return None
+        underlying = row.get('underlying') if _is_valid(row.get('underlying')) else contract.split('.')[0]
+        if underlying not in self.latest_ts or ts > self.latest_ts[underlying]:
+            self.latest_ts[underlying] = ts
+
+        last = row.get('last')
+        price = float(last) if _is_valid(last) and last > 0 else None
+        volume = int(row['volume']) if _is_valid(row.get('volume')) else None
+        oi = int(row['open_interest']) if _is_valid(row.get('open_interest')) else None
+
+        day = ts.date().isoformat()
+        seen = self.last_seen.get(contract)
+        if seen is not None and seen['date'] != day:
+            seen = None
+        prev_oi = seen['oi'] if seen is not None else None
+        # NSE volume is cumulative for the day; the first snapshot of a day carries
+        # everything traded since the open. A drop means a reset, so restart from it.
+        if volume is None:
+            volume_delta = 0
+        elif seen is None or seen['volume'] is None or volume < seen['volume']:
+            volume_delta = volume
+        else:
+            volume_delta = volume - seen['volume']
+        self.last_seen[contract] = {
+            'date': day,
+            'volume': volume if volume is not None else (seen['volume'] if seen else None),
+            'oi': oi if oi is not None else prev_oi,
+        }
+
+        for name, seconds in self.intervals.items():
+            start = bar_start_for(ts, seconds)
+            bars = self.open_bars[name]
+            bar = bars.get(contract)
+            if bar is not None and bar['bar_start'] != start:
+                if start < bar['bar_start']:
+                    continue  # out-of-order snapshot for an already rolled bar
+                self.closed_bars[name].append(bar)
+                bar = None
+            if bar is None:
+                bar = {
+                    'bar_start': start,
+                    'bar_end': start + timedelta(seconds=seconds),
+                    'symbol': contract,
+                    'underlying': underlying,
+                    'option_type': row.get('option_type'),
+                    'strike': int(row['strike']) if _is_valid(row.get('strike')) else None,
+                    'expiry': row.get('expiry'),
+                    'open': None, 'high': None, 'low': None, 'close': None,
+                    'volume': 0, 'pv': 0.0,
+                    'oi_prev': prev_oi, 'oi_open': oi, 'oi_close': oi,
+                    'snapshots': 0,
+                }
+                bars[contract] = bar
+            if price is not None:
+                if bar['open'] is None:
+                    bar['open'] = bar['high'] = bar['low'] = price
+                else:
+                    bar['high'] = max(bar['high'], price)
+                    bar['low'] = min(bar['low'], price)
+                bar['close'] = price
+                bar['pv'] += price * volume_delta
+            bar['volume'] += volume_delta
+            if oi is not None:
+                if bar['oi_open'] is None:
+                    bar['oi_open'] = oi
+                bar['oi_close'] = oi
+            bar['snapshots'] += 1
+        return underlying
+
+    def close_due(self, now: datetime, underlying: Optional[str] = None) -> None:
+        """
+        Close every open bar that ends at or before `now`, including contracts that
+        stopped updating. Limit to one underlying by passing `underlying`.
+        """
+        for name, bars in self.open_bars.items():
+            due = [c for c, bar in bars.items()
+                   if bar['bar_end'] <= now and (underlying is None or bar['underlying'] == underlying)]
+            for contract in due:
+                self.closed_bars[name].append(bars.pop(contract))
+
+    def flush(self) -> None:
+        """Close all open bars, e.g. at end of day or end of a backfill."""
+        for name, bars in self.open_bars.items():
+            self.closed_bars[name].extend(bars.values())
+            bars.clear()
+
+    def pop_closed(self, interval: str) -> pd.DataFrame:
+        """Return closed bars for `interval` as a DataFrame (BAR_COLUMNS) and clear them."""
+        bars = self.closed_bars[interval]
+        self.closed_bars[interval] = []
+        return _bars_frame(bars)
+
+    # -- persistence --
+    def save(self, write_csv: bool = True, engine=None, bars_dir: str = BARS_DIR, replace: bool = False) -> int:
+        """
+        Write closed bars to CSV (one file per underlying, day and interval under
+        `bars_dir`) and/or to table option_bars_<interval> when `engine` is given,
+        then persist the aggregator state. Returns the number of bars written.
+
+        Bars are appended by default. With replace=True (used by backfills) the files
+        and table rows of every (underlying, day, interval) being written are replaced,
+        so re-running a backfill or backfilling a day the scraper already covered
+        doesn't duplicate bars.
+
+        Closed bars are only dropped once at least one output holds them. If the
+        database write fails while CSV output is on, the bars are in the CSV (a
+        `backfill --write-db` restores the table); in database-only mode they stay
+        pending in the state file and are retried on the next save. A database
+        failure is re-raised after the remaining intervals and the state are saved.
+        """
+        written = 0
+        db_error = None
+        for name in self.intervals:
+            bars = self.closed_bars[name]
+            if not bars:
+                continue
+            df = _bars_frame(bars)
+            stored = False
+            if write_csv:
+                os.makedirs(bars_dir, exist_ok=True)
+                for (underlying, day), group in _group_by_underlying_day(df):
+                    out_path = os.path.join(bars_dir, f"{underlying}_{day}_{name}.csv")
+                    if replace or not os.path.exists(out_path):
+                        group.to_csv(out_path, index=False)
+                    else:
+                        group.to_csv(out_path, mode='a', header=False, index=False)
+                stored = True
+            if engine is not None:
+                table = bar_table_name(name)
+                try:
+                    with engine.begin() as conn:
+                        if replace:
+                            _delete_bar_days(conn, table, df)
+                        df.to_sql(table, con=conn, if_exists='append', index=False, method='multi', chunksize=1000,
+                                  dtype=datetime_dtypes(['bar_start', 'bar_end']))
+                    stored = True
+                except SQLAlchemyError as db_err:
+                    print(f"Failed to write {name} bars to '{table}': {db_err}")
+                    db_error = db_error or db_err
+            if not stored:
+                print(f"Keeping {len(df)} closed {name} bars for the next save")
+                continue
+            self.closed_bars[name] = []
+            written += len(df)
+            print(f"Wrote {len(df)} {name} bars")
+        self._save_state()
+        if db_error is not None:
+            raise db_error
+        return written
+
+    def _load_state(self) -> None:
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if state.get('intervals') != sorted(self.intervals):
+            print("Bar intervals changed since last run; starting with fresh bar state.")
+            return
+        self.last_seen = state.get('last_seen', {})
+        for name, bars in state.get('open_bars', {}).items():
+            for bar in bars.values():
+                bar['bar_start'] = datetime.fromisoformat(bar['bar_start'])
+                bar['bar_end'] = datetime.fromisoformat(bar['bar_end'])
+            self.open_bars[name] = bars
+        for name, bars in state.get('closed_bars', {}).items():
+            for bar in bars:
+                bar['bar_start'] = datetime.fromisoformat(bar['bar_start'])
+                bar['bar_end'] = datetime.fromisoformat(bar['bar_end'])
+            if name in self.closed_bars:
+                self.closed_bars[name] = bars
+        self.latest_ts = {u: datetime.fromisoformat(ts) for u, ts in state.get('latest_ts', {}).items()}
+
+    def _save_state(self) -> None:
+        if not self.state_file:
+            return
+        # Volume/OI baselines only matter within a day; drop contracts not seen on the
+        # latest snapshot's day (today, when live) so the state doesn't grow forever
+        if self.latest_ts:
+            today = max(self.latest_ts.values()).date().isoformat()
+            self.last_seen = {c: seen for c, seen in self.last_seen.items() if seen['date'] >= today}
+        state = {
+            'intervals': sorted(self.intervals),
+            'latest_ts': {u: ts.isoformat() for u, ts in self.latest_ts.items()},
+            'last_seen': self.last_seen,
+            'open_bars': {
+                name: {c: _bar_state(bar) for c, bar in bars.items()}
+                for name, bars in self.open_bars.items()
+            },
+            # Closed bars no output accepted yet (e.g. database down in database-only mode)
+            'closed_bars': {
+                name: [_bar_state(bar) for bar in bars] for name, bars in self.closed_bars.items() if bars
+            },
+        }
+        parent = os.path.dirname(self.state_file)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp_path, self.state_file)
+
+
+def _bar_state(bar: dict) -> dict:
+    return dict(bar, bar_start=bar['bar_start'].isoformat(), bar_end=bar['bar_end'].isoformat())
+
+
+def _bars_frame(bars: List[dict]) -> pd.DataFrame:
+    """Convert bar dicts to a DataFrame with BAR_COLUMNS, deriving vwap and oi_change."""
+    records = []
+    for bar in bars:
+        record = {k: bar.get(k) for k in BAR_COLUMNS}
+        record['vwap'] = bar['pv'] / bar['volume'] if bar['volume'] else None
+        baseline = bar['oi_prev'] if bar['oi_prev'] is not None else bar['oi_open']
+        record['oi_change'] = (bar['oi_close'] - baseline
+                               if bar['oi_close'] is not None and baseline is not None else None)
+        records.append(record)
+    return pd.DataFrame(records, columns=BAR_COLUMNS)
+
+
+def bar_table_name(interval: str) -> str:
+    return f"{BAR_TABLE_PREFIX}{interval.strip().lower()}"
+
+
+def _group_by_underlying_day(df: pd.DataFrame):
+    """Group bars by (underlying, bar day as YYYY-MM-DD)."""
+    return df.groupby([df['underlying'].fillna('UNKNOWN'), df['bar_start'].map(lambda d: d.date().isoformat())])
+
+
+def _delete_bar_days(conn, table: str, df: pd.DataFrame) -> None:
+    """Delete rows of `table` for every (underlying, day) present in `df`."""
+    if not inspect(conn).has_table(table):
+        return
+    quote = conn.dialect.identifier_preparer.quote_identifier
+    stmt = text(f"DELETE FROM {quote(table)} WHERE underlying = :underlying "
+                f"AND bar_start >= :day_start AND bar_start < :day_end")
+    for (underlying, day), _ in _group_by_underlying_day(df):
+        day_start = datetime.fromisoformat(day)
+        conn.execute(stmt, {'underlying': underlying, 'day_start': day_start,
+                            'day_end': day_start + timedelta(days=1)})
+
+
+# ---------- Backfill ----------
+def backfill_from_csv(paths: List[str], intervals: List[str], chunk_size: int = 50000) -> BarAggregator:
+    """Aggregate existing daily snapshot CSVs, reading each file in chunks."""
+    aggregator = BarAggregator(intervals, state_file=None)
+    for path in sorted(paths):
+        print(f"Backfilling from {path} ...")
+        for chunk in pd.read_csv(path, chunksize=chunk_size):
+            aggregator.update(chunk)
+    aggregator.flush()
+    return aggregator
+
+
+def backfill_from_db(engine, table_name: str, intervals: List[str], chunk_size: int = 50000) -> BarAggregator:
+    """Aggregate snapshot rows already stored in `table_name`, streamed in time order."""
+    aggregator = BarAggregator(intervals, state_file=None)
+    quote = engine.dialect.identifier_preparer.quote_identifier
+    columns = ', '.join(quote(col) for col in SNAPSHOT_COLUMNS)
+    # Same time the aggregator buckets by: NSE's server time, else the capture time
+    order = f"COALESCE({quote('server_timestamp')}, {quote('timestamp')}), {quote('timestamp')}"
+    query = text(f"SELECT {columns} FROM {quote(table_name)} ORDER BY {order}")
+    with engine.connect() as conn:
+        for chunk in pd.read_sql(query, conn, chunksize=chunk_size):
+            aggregator.update(chunk)
+    aggregator.flush()
+    return aggregator
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Option chain OHLC/OI bars.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    backfill = sub.add_parser("backfill", help="Build bars from existing CSV or DB history "
+                                               "(replaces existing bars for the days covered)")
+    backfill.add_argument("--csv", nargs="*", help="Snapshot CSVs (default: data/daily/*.csv)")
+    backfill.add_argument("--db", action="store_true", help="Read history from the database instead of CSVs")
+    backfill.add_argument("--table", default=os.environ.get('OPTION_CHAIN_TABLE', 'option_chain'))
+    backfill.add_argument("--out-dir", default=BARS_DIR)
+    backfill.add_argument("--write-db", action="store_true", help="Also write bars to option_bars_<interval>")
+
+    flush = sub.add_parser("flush", help="Close and write all open bars (end of day)")
+    flush.add_argument("--write-db", action="store_true", help="Also write bars to option_bars_<interval>")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    intervals = get_intervals()
+    engine = get_engine() if (args.write_db or getattr(args, 'db', False)) else None
+    if (args.write_db or getattr(args, 'db', False)) and engine is None:
+        print("DATABASE_URL not set.")
+        sys.exit(1)
+
+    if args.command == 'backfill':
+        if args.db:
+            aggregator = backfill_from_db(engine, args.table, intervals)
+        else:
+            paths = args.csv or glob.glob(os.path.join('data', 'daily', '*.csv'))
+            if not paths:
+                print("No CSV files to backfill from.")
+                sys.exit(1)
+            aggregator = backfill_from_csv(paths, intervals)
+        total = aggregator.save(write_csv=True, engine=engine if args.write_db else None, bars_dir=args.out_dir,
+                                replace=True)
+        print(f"Backfill complete: {total} bars.")
+    else:
+        aggregator = BarAggregator(intervals)
+        aggregator.flush()
+        total = aggregator.save(write_csv=True, engine=engine)
+        print(f"Flushed {total} bars.")
@@ -1,7 +1,12 @@
 import os
 from typing import Optional
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.dialects import mysql
 from sqlalchemy.engine import Engine
+from sqlalchemy.types import DateTime, TypeEngine
+
+# Datetime columns written by the scraper
+DATETIME_COLUMNS = ['timestamp', 'server_timestamp', 'request_start', 'request_end']
 
 
 def get_database_url() -> Optional[str]:
@@ -27,3 +32,56 @@ def get_engine(echo: bool = False, pool_size: int = 5, max_overflow: int = 10) -
     return create_engine(db_url, echo=echo, pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True)
 
 
+def datetime_type() -> TypeEngine:
+    """
+    Return a DateTime type that keeps microsecond precision on every supported engine.
+    """
+    # MySQL's plain DATETIME truncates to whole seconds, so request microsecond
+    # precision there (other engines keep it by default)
+    return DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql', 'mariadb')
+
+
+def datetime_dtypes(columns=DATETIME_COLUMNS) -> dict:
+    """
+    Build a `dtype=` mapping for DataFrame.to_sql so datetime columns are created
+    with microsecond precision.
+    """
+    return {col: datetime_type() for col in columns}
+
+
+def migrate_option_chain_table(engine: Engine, table_name: str) -> list:
+    """
+    Bring an existing option chain table up to the current row layout: add missing
+    datetime columns and convert ones stored as text (tables created by setup_db.py
+    from an old CSV header are all VARCHAR) to microsecond datetimes.
+    A table that doesn't exist yet is left alone; to_sql creates it with
+    datetime_dtypes(). Returns the statements executed.
+    """
+    insp = inspect(engine)
+    if not insp.has_table(table_name):
+        return []
+    existing = {c['name']: c['type'] for c in insp.get_columns(table_name)}
+    dialect = engine.dialect.name
+    quote = engine.dialect.identifier_preparer.quote_identifier
+    table = quote(table_name)
+    dt_sql = datetime_type().compile(dialect=engine.dialect)
+
+    statements = []
+    for col in DATETIME_COLUMNS:
+        if col not in existing:
+            statements.append(f"ALTER TABLE {table} ADD COLUMN {quote(col)} {dt_sql} NULL")
+        elif not isinstance(existing[col], DateTime):
+            if dialect in ('mysql', 'mariadb'):
+                statements.append(f"ALTER TABLE {table} MODIFY COLUMN {quote(col)} {dt_sql} NULL")
+            elif dialect == 'postgresql':
+                statements.append(f"ALTER TABLE {table} ALTER COLUMN {quote(col)} TYPE {dt_sql} "
+                                  f"USING {quote(col)}::timestamp")
+            else:
+                print(f"Column '{col}' in '{table_name}' is {existing[col]}; "
+                      f"converting it is not supported on {dialect}. Leaving as is.")
+    if statements:
+        with engine.begin() as conn:
+            for stmt in statements:
+                print(f"Migrating '{table_name}': {stmt}")
+                conn.execute(text(stmt))
+    return statements
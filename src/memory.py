@@ -0,0 +1,75 @@
+import gc
+import os
+import sys
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class MemoryCeilingExceeded(RuntimeError):
+    """Raised when the process RSS stays above the configured ceiling after a GC pass."""
+
+
+def get_memory_ceiling_mb() -> Optional[float]:
+    """
+    Read the RSS ceiling from environment variable MAX_RSS_MB.
+    Returns None (no ceiling) when unset, empty or non-positive.
+    """
+    value = os.environ.get('MAX_RSS_MB', '')
+    try:
+        ceiling = float(value)
+    except ValueError:
+        return None
+    return ceiling if ceiling > 0 else None
+
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident set size in MB, or None if it can't be determined on this platform."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return peak / divisor
+
+
+def check_memory_ceiling(ceiling_mb: Optional[float]) -> None:
+    """
+    Raise MemoryCeilingExceeded if RSS is above `ceiling_mb`.
+    A full GC pass is attempted first so transient garbage doesn't trip the check.
+    """
+    if ceiling_mb is None:
+        return
+    rss = current_rss_mb()
+    if rss is None or rss <= ceiling_mb:
+        return
+    gc.collect()
+    rss = current_rss_mb()
+    if rss is not None and rss > ceiling_mb:
+        raise MemoryCeilingExceeded(f"RSS {rss:.1f} MB exceeds ceiling of {ceiling_mb:.1f} MB")
+
+
+def format_memory_report() -> str:
+    """One-line summary of current and peak RSS for logging."""
+    rss = current_rss_mb()
+    peak = peak_rss_mb()
+    # ru_maxrss and statm are sampled differently and the peak can read slightly below
+    # the current RSS; the peak is never less than what is resident now
+    if peak is not None and rss is not None:
+        peak = max(peak, rss)
+    rss_str = f"{rss:.1f} MB" if rss is not None else "n/a"
+    peak_str = f"{peak:.1f} MB" if peak is not None else "n/a"
+    return f"RSS {rss_str}, peak RSS {peak_str}"
@@ -1,9 +1,11 @@
 import requests
 import time
 import json
+from datetime import datetime, timedelta
 from requests.exceptions import RequestException
 
 NSE_URL = 'https://www.nseindia.com/api/option-chain-indices?symbol={symbol}'
+HOMEPAGE_URL = 'https://www.nseindia.com/option-chain'
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
                   "(KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
@@ -18,44 +20,104 @@ REQUIRED_FIELDS = [
     'strikePrice', 'expiryDate', 'bidprice', 'askPrice', 'lastPrice', 'totalTradedVolume', 'openInterest'
 ]
 
+# Format of records.timestamp in the NSE payload, e.g. '17-Oct-2025 15:30:00' (IST)
+NSE_TIMESTAMP_FORMAT = '%d-%b-%Y %H:%M:%S'
 
-def fetch_all_option_chain(symbol, retries=3, backoff=2):
-    HOMEPAGE_URL = "https://www.nseindia.com/option-chain"
+
+def parse_nse_timestamp(value):
+    """Parse NSE's records.timestamp into a naive IST datetime, or None if absent/unparseable."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip(), NSE_TIMESTAMP_FORMAT)
+    except (ValueError, AttributeError):
+        return None
+
+
+def wall_clock_anchor(tz=None):
+    """
+    Return (wall_datetime, monotonic_ns) captured together. Later monotonic readings
+    can be converted to wall time with monotonic_to_wall() without being affected by
+    NTP steps or clock adjustments in between.
+    """
+    return datetime.now(tz).replace(tzinfo=None), time.monotonic_ns()
+
+
+def monotonic_to_wall(anchor, monotonic_ns):
+    """Convert a time.monotonic_ns() reading to a naive wall-clock datetime using an anchor."""
+    wall, anchor_ns = anchor
+    return wall + timedelta(microseconds=(monotonic_ns - anchor_ns) / 1000)
+
+
+def warm_nse_session(session, log=print):
+    """Visit the NSE option-chain page so `session` picks up the cookies the API requires."""
+    log("Visiting homepage to set cookies...")
+    res = session.get(HOMEPAGE_URL, headers=HEADERS, timeout=10)
+    log(f"Homepage status: {res.status_code}")
+    time.sleep(2)
+
+
+def fetch_all_option_chain(symbol, retries=3, backoff=2, anchor=None, session=None, verbose=True):
+    """
+    Fetch the full option chain for `symbol`.
+
+    Besides the chain itself, the result carries NSE's own snapshot time
+    ('timestamp', parsed from records.timestamp) and the wall-clock start/end of the
+    API request ('request_start', 'request_end'), derived from monotonic readings
+    relative to `anchor` (see wall_clock_anchor()). All times are naive datetimes in
+    the anchor's timezone.
+
+    Pass a `session` to reuse cookies across calls (e.g. a live view polling every
+    second); the homepage is then only visited when the session has no cookies yet or
+    after a failed attempt. Without one, every attempt starts a fresh session.
+    Set verbose=False to silence progress output.
+    """
+    if anchor is None:
+        anchor = wall_clock_anchor()
+    log = print if verbose else (lambda *args, **kwargs: None)
     API_URL = f"https://www.nseindia.com/api/option-chain-indices?symbol={symbol}"
+    own_session = session is None
     for attempt in range(retries):
         try:
-            session = requests.Session()
-            print("Visiting homepage to set cookies...")
-            res = session.get(HOMEPAGE_URL, headers=HEADERS, timeout=10)
-            print(f"Homepage status: {res.status_code}")
-            time.sleep(2)
-            print("Hitting the API...")
+            if own_session:
+                session = requests.Session()
+            if own_session or attempt > 0 or not session.cookies:
+                warm_nse_session(session, log)
+            log("Hitting the API...")
+            request_start_ns = time.monotonic_ns()
             response = session.get(API_URL, headers=HEADERS, timeout=10)
-            print(f"API Status: {response.status_code}")
+            request_end_ns = time.monotonic_ns()
+            log(f"API Status: {response.status_code}")
             content_type = response.headers.get("Content-Type", "")
-            print("Content-Type:", content_type)
+            log("Content-Type:", content_type)
             if response.status_code == 200:
                 if "application/json" in content_type:
                     try:
-                        json_data = response.json()
+                        # Decode straight from bytes; avoids holding a decoded str copy alongside the objects
+                        json_data = json.loads(response.content)
+                        del response
                         data = json_data['records']['data']
                         expiry_dates = json_data['records']['expiryDates']
                         underlying_value = json_data['records'].get('underlyingValue')
-                        print("JSON fetched successfully.")
+                        server_timestamp = parse_nse_timestamp(json_data['records'].get('timestamp'))
+                        log(f"JSON fetched successfully. Server timestamp: {server_timestamp}")
                         return {
                             'data': data, 
                             'expiry_dates': expiry_dates,
-                            'underlyingValue': underlying_value
+                            'underlyingValue': underlying_value,
+                            'timestamp': server_timestamp,
+                            'request_start': monotonic_to_wall(anchor, request_start_ns),
+                            'request_end': monotonic_to_wall(anchor, request_end_ns),
                         }
                     except json.JSONDecodeError:
-                        print("JSONDecodeError - Invalid JSON format.")
-                        print("Raw Response:")
-                        print(response.text[:1000])
+                        log("JSONDecodeError - Invalid JSON format.")
+                        log("Raw Response:")
+                        log(response.text[:1000])
                         raise
                 else:
-                    print("Expected JSON but got:", content_type)
-                    print("Raw HTML/Other:")
-                    print(response.text[:1000])
+                    log("Expected JSON but got:", content_type)
+                    log("Raw HTML/Other:")
+                    log(response.text[:1000])
                     raise Exception("NSE returned unexpected content format.")
             else:
                 raise Exception(f"Failed to fetch data, status code: {response.status_code}")
@@ -66,14 +128,34 @@ def fetch_all_option_chain(symbol, retries=3, backoff=2):
                 raise RuntimeError(f"Failed to fetch data from NSE after {retries} attempts: {e}")
 
 def format_for_nautilus(option_chain, underlying, exchange, timestamp):
+    """
+    Flatten an option chain into one row per contract.
+
+    `timestamp` is the local capture time (datetime). NSE's snapshot time and the
+    request start/end times are taken from `option_chain` when present.
+    """
+    return list(iter_nautilus_rows(option_chain, underlying, exchange, timestamp))
+
+
+def iter_nautilus_rows(option_chain, underlying, exchange, timestamp, release=False):
+    """
+    Generator form of format_for_nautilus(), yielding one row at a time.
+
+    With release=True each raw entry in option_chain['data'] is dropped as soon as it
+    has been converted, so the decoded payload shrinks while rows are produced and
+    the two never coexist in full. The option chain can't be re-read afterwards.
+    """
     data = option_chain['data']
-    expiry_dates = option_chain['expiry_dates']
-    rows = []
+    server_timestamp = option_chain.get('timestamp')
+    request_start = option_chain.get('request_start')
+    request_end = option_chain.get('request_end')
     
     # Get the overall underlying value from records level
     records_underlying_value = option_chain.get('underlyingValue')
     
-    for entry in data:
+    for i, entry in enumerate(data):
+        if release:
+            data[i] = None
         strike = entry.get('strikePrice')
         expiry = entry.get('expiryDate')
         for opt_type, nse_type, label in [('CE', 'CALL', 'CALL'), ('PE', 'PUT', 'PUT')]:
@@ -90,6 +172,9 @@ def format_for_nautilus(option_chain, underlying, exchange, timestamp):
             
             row = {
                 'timestamp': timestamp,
+                'server_timestamp': server_timestamp,
+                'request_start': request_start,
+                'request_end': request_end,
                 'symbol': symbol_str,
                 'option_type': label,
                 'strike': int(strike),
@@ -108,5 +193,4 @@ def format_for_nautilus(option_chain, underlying, exchange, timestamp):
                 'identifier': opt.get('identifier'),
                 'pChange': float(opt.get('pChange', 0)) if opt.get('pChange') is not None else None,
             }
-            rows.append(row)
-    return rows 
\ No newline at end of file
+            yield row 
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import requests
+
+# Make sure src is on PYTHONPATH for relative imports when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.nse_scraper import fetch_all_option_chain
+
+# Option chain columns in NSE website order: CALLS | STRIKE | PUTS
+OC_COLS = [
+    'c_OI', 'c_CHNG_IN_OI', 'c_VOLUME', 'c_IV', 'c_LTP', 'c_CHNG',
+    'c_BID_QTY', 'c_BID', 'c_ASK', 'c_ASK_QTY',
+    'STRIKE', 'p_BID_QTY', 'p_BID', 'p_ASK', 'p_ASK_QTY',
+    'p_CHNG', 'p_LTP', 'p_IV', 'p_VOLUME', 'p_CHNG_IN_OI', 'p_OI'
+]
+
+# NSE payload keys feeding each side of the matrix, in OC_COLS order
+CE_FIELDS = [
+    'openInterest', 'changeinOpenInterest', 'totalTradedVolume', 'impliedVolatility', 'lastPrice', 'change',
+    'bidQty', 'bidprice', 'askPrice', 'askQty'
+]
+PE_FIELDS = [
+    'bidQty', 'bidprice', 'askPrice', 'askQty', 'change', 'lastPrice', 'impliedVolatility',
+    'totalTradedVolume', 'changeinOpenInterest', 'openInterest'
+]
+
+# Columns holding counts; everything else is a price/percentage
+INT_COLS = {
+    'c_OI', 'c_CHNG_IN_OI', 'c_VOLUME', 'c_BID_QTY', 'c_ASK_QTY',
+    'STRIKE', 'p_BID_QTY', 'p_ASK_QTY', 'p_VOLUME', 'p_CHNG_IN_OI', 'p_OI'
+}
+INT_COL_MASK = np.array([col in INT_COLS for col in OC_COLS])
+
+STRIKE_IDX = OC_COLS.index('STRIKE')
+_MISSING_SIDE = [None] * len(CE_FIELDS)
+
+
+def build_oc_matrices(option_chain, expiries=None):
+    """
+    Build the CE|STRIKE|PE matrix for each expiry in a single pass over the chain.
+
+    Returns {expiry: {'values': float64 array (n_strikes x len(OC_COLS)),
+                      'mask': bool array, True where NSE provided a value}}
+    with rows sorted by strike. Missing legs are NaN in 'values' and False in 'mask';
+    the input chain is not modified. Pass `expiries` to limit which expiries are built.
+    """
+    wanted = set(expiries) if expiries is not None else None
+    buckets = {}
+    for entry in option_chain['data']:
+        expiry = entry.get('expiryDate')
+        if wanted is not None and expiry not in wanted:
+            continue
+        ce = entry.get('CE')
+        pe = entry.get('PE')
+        if ce and ce.get('expiryDate') != expiry:
+            ce = None
+        if pe and pe.get('expiryDate') != expiry:
+            pe = None
+        row = [ce.get(k) for k in CE_FIELDS] if ce else list(_MISSING_SIDE)
+        row.append(entry.get('strikePrice'))
+        row.extend([pe.get(k) for k in PE_FIELDS] if pe else _MISSING_SIDE)
+        buckets.setdefault(expiry, []).append(row)
+
+    matrices = {}
+    for expiry, rows in buckets.items():
+        # None becomes NaN under a float64 dtype, giving the null mask for free
+        values = np.array(rows, dtype=np.float64)
+        values = values[np.argsort(values[:, STRIKE_IDX], kind='stable')]
+        matrices[expiry] = {'values': values, 'mask': ~np.isnan(values)}
+    return matrices
+
+
+def matrix_to_frame(matrix):
+    """Convert a matrix from build_oc_matrices() to a DataFrame with nullable Int64/Float64 columns."""
+    values = matrix['values']
+    mask = matrix['mask']
+    columns = {}
+    for j, col in enumerate(OC_COLS):
+        missing = ~mask[:, j]
+        if INT_COL_MASK[j]:
+            columns[col] = pd.arrays.IntegerArray(np.where(missing, 0, values[:, j]).astype(np.int64), missing)
+        else:
+            columns[col] = pd.arrays.FloatingArray(values[:, j], missing)
+    return pd.DataFrame(columns)
+
+
+def _format_cell(value, present, is_int):
+    """Format one cell like the NSE website: '-' for missing or zero, trailing zeros trimmed."""
+    if not present or value == 0:
+        return '-'
+    if is_int:
+        return '%d' % value
+    return ('%.2f' % value).rstrip('0').rstrip('.')
+
+
+def render_matrix(matrix, header=None):
+    """Render a matrix from build_oc_matrices() as an aligned text table."""
+    values = matrix['values'].tolist()
+    mask = matrix['mask'].tolist()
+    int_cols = INT_COL_MASK.tolist()
+    cells = [
+        [_format_cell(v, m, i) for v, m, i in zip(row, row_mask, int_cols)]
+        for row, row_mask in zip(values, mask)
+    ]
+    widths = [len(col) for col in OC_COLS]
+    for row in cells:
+        widths = [max(w, len(c)) for w, c in zip(widths, row)]
+    lines = [] if header is None else [header]
+    lines.append(' '.join(col.rjust(w) for col, w in zip(OC_COLS, widths)))
+    lines.extend(' '.join(c.rjust(w) for c, w in zip(row, widths)) for row in cells)
+    return '\n'.join(lines)
+
+
+def watch(symbol, expiry=None, interval=1.0, once=False):
+    """
+    Refresh the option chain matrix for `symbol` in the terminal every `interval` seconds.
+    Defaults to the nearest expiry. Uses the same fetch path as the scraper, with a
+    persistent session so cookies are only set up once.
+    """
+    session = requests.Session()
+    while True:
+        started = time.monotonic()
+        try:
+            option_chain = fetch_all_option_chain(symbol, session=session, verbose=False)
+            target = expiry or option_chain['expiry_dates'][0]
+            matrix = build_oc_matrices(option_chain, expiries=[target]).get(target)
+            header = (f"{symbol} {target} | underlying {option_chain.get('underlyingValue')} "
+                      f"| server time {option_chain.get('timestamp')}")
+            text = render_matrix(matrix, header) if matrix is not None else f"No data for expiry {target}"
+        except Exception as e:
+            text = f"Error fetching {symbol}: {e}"
+        if not once:
+            # Clear screen and move cursor home
+            sys.stdout.write('\033[H\033[2J')
+        print(text, flush=True)
+        if once:
+            return
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Live NSE-style option chain view.")
+    parser.add_argument("symbol", nargs="?", default="NIFTY")
+    parser.add_argument("--expiry", help="Expiry date as shown by NSE, e.g. 30-Oct-2025 (default: nearest)")
+    parser.add_argument("--interval", type=float, default=1.0, help="Refresh interval in seconds")
+    parser.add_argument("--once", action="store_true", help="Print a single snapshot and exit")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        watch(args.symbol, expiry=args.expiry, interval=args.interval, once=args.once)
+    except KeyboardInterrupt:
+        pass
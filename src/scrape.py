@@ -1,12 +1,10 @@
-import requests
 import json
 import pandas as pd
 import sys
-import time
 import os
+from contextlib import ExitStack
 from datetime import datetime, time as dtime
 import pytz
-from requests.exceptions import RequestException
 from sqlalchemy.exc import SQLAlchemyError
 from typing import Optional
 
@@ -14,112 +12,30 @@ from typing import Optional
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from config.nse_holidays import NSE_HOLIDAYS_2024
-from src.nse_scraper import fetch_all_option_chain, format_for_nautilus
-from src.utils.utils import is_nse_holiday
-from src.db import get_engine
-
-# Twilio WhatsApp Configuration
-TWILIO_ACCOUNT_SID = 'AC67cffc84b0ffca0cb95e91604a4f13f8'  # Replace with your actual Account SID
-TWILIO_AUTH_TOKEN = 'da74f025d5742ae039d8dcc532c5dff0'
-TWILIO_WHATSAPP_TO = 'whatsapp:+919656554244'
-TWILIO_WHATSAPP_FROM = 'whatsapp:+14155238886'
-
-# List of fields not required in output while displaying option chain data
-EXCLUDE_KEYS = [
-    'pchangeinOpenInterest', 'totalBuyQuantity', 'totalSellQuantity',
-    'underlyingValue', 'expiryDate', 'underlying', 'identifier', 'pChange'
-]
-
-NSE_URL = 'https://www.nseindia.com/api/option-chain-indices?symbol={symbol}'
-HEADERS = {
-    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                  'AppleWebKit/537.36 (KHTML, like Gecko) '
-                  'Chrome/100.0.4896.127 Safari/537.36'
-}
-
-OC_COLS = [
-    'c_OI', 'c_CHNG_IN_OI', 'c_VOLUME', 'c_IV', 'c_LTP', 'c_CHNG',
-    'c_BID_QTY', 'c_BID', 'c_ASK', 'c_ASK_QTY',
-    'STRIKE', 'p_BID_QTY', 'p_BID', 'p_ASK', 'p_ASK_QTY',
-    'p_CHNG', 'p_LTP', 'p_IV', 'p_VOLUME', 'p_CHNG_IN_OI', 'p_OI'
-]
+from src.nse_scraper import fetch_all_option_chain, iter_nautilus_rows, wall_clock_anchor
+from src.utils.utils import is_nse_holiday, chunked
+from src.memory import MemoryCeilingExceeded, check_memory_ceiling, get_memory_ceiling_mb, format_memory_report
+from src.db import get_engine, datetime_dtypes, migrate_option_chain_table, DATETIME_COLUMNS
+from src.alerts import get_dispatcher, backends_from_env, deliver
+from src.bars import BarAggregator, get_intervals, bar_table_name
 
 OUTPUT_DIR = os.path.join('data', 'daily')
 EXCHANGE = 'NSE'
 SYMBOLS = ['NIFTY', 'BANKNIFTY']
+MARKET_CLOSE = dtime(15, 30)
 
+# Last ingested NSE server timestamp per symbol, used to skip unchanged snapshots
+SNAPSHOT_STATE_FILE = os.path.join(OUTPUT_DIR, '.last_server_timestamps.json')
+# Microsecond precision for datetime columns in CSV output
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+# Rows converted and written per chunk; bounds per-symbol memory independent of chain size
+DEFAULT_CHUNK_SIZE = 500
+# Minutes of data per CSV file. Each finished segment stops being written and can be backed
+# up while the day is still running; 0 keeps a single <SYMBOL>_<date>.csv per day.
+DEFAULT_CSV_SEGMENT_MINUTES = 60
 
-# ---------- Helper functions ----------
-def set_decimal(x):
-    """Restrict decimal value to 2 places, remove trailing zeros."""
-    return ('%.2f' % x).rstrip('0').rstrip('.') if isinstance(x, float) else x
-
-def fetch_nse_data(url, headers, timeout=10, retries=3, backoff=2):
-    """Fetch data from NSE with retry logic."""
-    for attempt in range(retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=timeout)
-            response.raise_for_status()
-            return response.json()
-        except (RequestException, json.JSONDecodeError) as e:
-            if attempt < retries - 1:
-                time.sleep(backoff ** attempt)
-            else:
-                raise RuntimeError(f"Failed to fetch data from NSE after {retries} attempts: {e}")
-
-def filter_oc_data(expiry_dates, data):
-    """Organize option chain data by expiry date."""
-    oc_d = {ed: {"CE": [], "PE": []} for ed in expiry_dates}
-    for entry in data:
-        ed = entry.get('expiryDate')
-        if ed in oc_d:
-            ce = entry.get('CE')
-            pe = entry.get('PE')
-            oc_d[ed]["CE"].append(ce if ce and ce.get('expiryDate') == ed else '-')
-            oc_d[ed]["PE"].append(pe if pe and pe.get('expiryDate') == ed else '-')
-    return oc_d
-
-def create_final_oc_matrix(CE, PE):
-    """Format and create final list of Option Chain data similar to NSE website."""
-    l_OC = []
-    for i in range(len(CE)):
-        ce = CE[i]
-        pe = PE[i]
-        if ce != '-':
-            for key in EXCLUDE_KEYS:
-                ce.pop(key, None)
-        if pe != '-':
-            for key in EXCLUDE_KEYS:
-                pe.pop(key, None)
-
-    for i in range(len(CE)):
-        ce = CE[i]
-        pe = PE[i]
-        l_CE = []
-        l_PE = []
-        if ce != '-':
-            sp = ce['strikePrice']
-            l_CE = [
-                ce.get('openInterest', '-'), ce.get('changeinOpenInterest', '-'), ce.get('totalTradedVolume', '-'),
-                ce.get('impliedVolatility', '-'), ce.get('lastPrice', '-'), set_decimal(ce.get('change', '-')),
-                ce.get('bidQty', '-'), ce.get('bidprice', '-'), ce.get('askPrice', '-'), ce.get('askQty', '-'), sp
-            ]
-        else:
-            sp = pe['strikePrice'] if pe != '-' else '-'
-            l_CE = ['-'] * 10 + [sp]
-        if pe != '-':
-            l_PE = [
-                pe.get('bidQty', '-'), pe.get('bidprice', '-'), pe.get('askPrice', '-'), pe.get('askQty', '-'),
-                set_decimal(pe.get('change', '-')), pe.get('lastPrice', '-'), pe.get('impliedVolatility', '-'),
-                pe.get('totalTradedVolume', '-'), pe.get('changeinOpenInterest', '-'), pe.get('openInterest', '-')
-            ]
-        else:
-            l_PE = ['-'] * 10
-        l_OC_t = l_CE + l_PE
-        l_OC_t = [x if x != 0 else '-' for x in l_OC_t]
-        l_OC.append(l_OC_t)
-    return l_OC
 
+# ---------- Helper functions ----------
 def ensure_output_dir():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
@@ -127,13 +43,87 @@ def ensure_output_dir():
 def get_today_str():
     return datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d')
 
+def load_snapshot_state(path=SNAPSHOT_STATE_FILE):
+    """Return {symbol: last ingested server timestamp (ISO string)}; empty if missing or unreadable."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_snapshot_state(state, path=SNAPSHOT_STATE_FILE):
+    """Persist the snapshot state atomically so a crash can't leave a truncated file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def rows_to_frame(rows):
+    """Build a DataFrame from formatted rows with native datetime columns."""
+    df = pd.DataFrame(rows)
+    for col in DATETIME_COLUMNS:
+        df[col] = pd.to_datetime(df[col])
+    return df
+
+def csv_segment_path(symbol, captured_at, segment_minutes=DEFAULT_CSV_SEGMENT_MINUTES):
+    """
+    CSV path for a snapshot of `symbol` captured at `captured_at`:
+    <SYMBOL>_<date>_<HHMM>.csv, HHMM being the start of its `segment_minutes` slice of
+    the day, or <SYMBOL>_<date>.csv when segment_minutes is 0.
+    """
+    day = captured_at.strftime('%Y-%m-%d')
+    if segment_minutes <= 0:
+        return os.path.join(OUTPUT_DIR, f"{symbol}_{day}.csv")
+    minute = (captured_at.hour * 60 + captured_at.minute) // segment_minutes * segment_minutes
+    return os.path.join(OUTPUT_DIR, f"{symbol}_{day}_{minute // 60:02d}{minute % 60:02d}.csv")
+
+def rotate_if_header_differs(out_path, columns):
+    """
+    If `out_path` exists with a different header than `columns` (e.g. written before a
+    column was added), move it aside to <name>.<n>.csv so new rows start a fresh file
+    instead of being appended under the wrong header. Returns the rotated path or None.
+    """
+    if not os.path.exists(out_path):
+        return None
+    with open(out_path, newline='') as f:
+        header = f.readline().rstrip('\r\n')
+    if header == ','.join(columns):
+        return None
+    root, ext = os.path.splitext(out_path)
+    n = 1
+    while os.path.exists(f"{root}.{n}{ext}"):
+        n += 1
+    rotated = f"{root}.{n}{ext}"
+    os.replace(out_path, rotated)
+    print(f"CSV header changed; moved {out_path} to {rotated}")
+    return rotated
+
+def write_csv_chunk(df, out_path):
+    """Append a chunk to the daily CSV, writing the header only when the file is new."""
+    rotate_if_header_differs(out_path, df.columns)
+    if os.path.exists(out_path):
+        df.to_csv(out_path, mode='a', header=False, index=False, date_format=CSV_DATE_FORMAT)
+    else:
+        df.to_csv(out_path, index=False, date_format=CSV_DATE_FORMAT)
+
+def memory_ceiling_hit(max_rss_mb, symbol, stage):
+    """Return True, after printing and alerting, if RSS is above the ceiling and `symbol` must be skipped."""
+    try:
+        check_memory_ceiling(max_rss_mb)
+    except MemoryCeilingExceeded as e:
+        error_msg = str(e)
+        print(f"Skipping {symbol} ({stage}): {error_msg}")
+        notify_error("Memory Ceiling Exceeded", f"{error_msg}. {symbol} skipped ({stage}).", f"Symbol: {symbol}")
+        return True
+    return False
+
 # ---------- New market status helpers ----------
 def is_market_hours():
     tz = pytz.timezone('Asia/Kolkata')
     now = datetime.now(tz).time()
     start = dtime(9, 15)
-    end = dtime(15, 30)
-    return start <= now <= end
+    return start <= now <= MARKET_CLOSE
 
 def get_market_status():
     tz = pytz.timezone('Asia/Kolkata')
@@ -146,86 +136,44 @@ def get_market_status():
         'is_holiday': is_nse_holiday(now.strftime('%Y-%m-%d'))
     }
 
-# ---------- WhatsApp Notification Functions ----------
-def send_whatsapp_notification(message: str) -> bool:
-    """Send WhatsApp notification via Twilio API."""
-    url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
-    
-    try:
-        response = requests.post(
-            url,
-            data={
-                'To': TWILIO_WHATSAPP_TO,
-                'From': TWILIO_WHATSAPP_FROM,
-                'Body': message
-            },
-            auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
-            timeout=10
-        )
-        response.raise_for_status()
-        print(f"✅ WhatsApp notification sent successfully (Status: {response.status_code})")
-        return True
-    except requests.exceptions.HTTPError as e:
-        error_detail = ""
-        try:
-            error_detail = response.json() if hasattr(e, 'response') and e.response else ""
-        except:
-            pass
-        print(f"❌ Failed to send WhatsApp notification (HTTP {response.status_code if 'response' in locals() else 'N/A'}): {e}")
-        if error_detail:
-            print(f"   Twilio error details: {error_detail}")
-        return False
-    except Exception as e:
-        # Don't raise - notification failures shouldn't break the scraper
-        print(f"❌ Failed to send WhatsApp notification: {e}")
-        return False
-
-
+# ---------- Notification Functions ----------
 def notify_error(error_type: str, error_message: str, context: Optional[str] = None) -> None:
-    """Format and send error notification via WhatsApp."""
-    timestamp = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d %H:%M:%S IST')
-    
-    msg_parts = [
-        f"🚨 DataScraper Error",
-        f"Time: {timestamp}",
-        f"Type: {error_type}"
-    ]
-    
-    if context:
-        msg_parts.append(f"Context: {context}")
-    
-    msg_parts.append(f"Error: {error_message}")
-    
-    message = "\n".join(msg_parts)
-    send_whatsapp_notification(message)
+    """
+    Queue an error alert. Delivery, deduplication and rate limiting happen on the
+    alert dispatcher's background worker, so this never blocks the scrape loop.
+    """
+    get_dispatcher().notify(error_type, error_message, context)
 
 
 def send_test_notification():
-    """Send a test WhatsApp message to verify notification setup."""
-    print("Testing WhatsApp notification setup...")
-    print(f"Account SID: {TWILIO_ACCOUNT_SID[:10]}...")
-    print(f"To: {TWILIO_WHATSAPP_TO}")
-    print(f"From: {TWILIO_WHATSAPP_FROM}")
+    """Send a test message synchronously to every configured alert backend."""
+    print("Testing alert notification setup...")
+    backends = backends_from_env()
+    if not backends:
+        print("❌ No alert backends configured.")
+        print("   Set ALERT_BACKENDS (twilio, webhook, file) and the matching variables:")
+        print("   - twilio: TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_WHATSAPP_TO, TWILIO_WHATSAPP_FROM")
+        print("   - webhook: ALERT_WEBHOOK_URL")
+        print("   - file: ALERT_FILE_PATH (default data/alerts.log)")
+        return False
+    print(f"Backends: {', '.join(b.name for b in backends)}")
     
     timestamp = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d %H:%M:%S IST')
     
     test_message = (
         "✅ DataScraper Test Message\n"
         f"Time: {timestamp}\n"
-        "This is a test notification to verify WhatsApp setup is working correctly.\n"
+        "This is a test notification to verify alert setup is working correctly.\n"
         "If you receive this, notifications are configured properly!"
     )
     
-    result = send_whatsapp_notification(test_message)
+    result = deliver(backends, test_message)
     if result:
-        print("✅ Test message sent successfully! Check your WhatsApp.")
+        print("✅ Test message sent successfully!")
     else:
-        print("❌ Failed to send test message. Check Twilio configuration in scrape.py")
-        print("   Make sure:")
-        print("   1. TWILIO_ACCOUNT_SID is correct")
-        print("   2. TWILIO_AUTH_TOKEN is correct")
-        print("   3. WhatsApp numbers are in format: whatsapp:+1234567890")
-        print("   4. Your Twilio account has WhatsApp enabled")
+        print("❌ Failed to send test message. Check the alert backend environment variables.")
+        print("   For Twilio WhatsApp numbers must be in format: whatsapp:+1234567890")
+        print("   and your Twilio account must have WhatsApp enabled.")
     return result
 
 # ---------- Main scraper ----------
@@ -235,15 +183,25 @@ def main():
     write_db = os.environ.get('WRITE_DB', 'true').lower() == 'true'
     override_hours = os.environ.get('OVERRIDE_MARKET_HOURS', 'false').lower() == 'true'
     table_name = os.environ.get('OPTION_CHAIN_TABLE', 'option_chain')
+    dedup_snapshots = os.environ.get('DEDUP_SNAPSHOTS', 'true').lower() == 'true'
+    chunk_size = int(os.environ.get('CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    segment_minutes = int(os.environ.get('CSV_SEGMENT_MINUTES', DEFAULT_CSV_SEGMENT_MINUTES))
+    max_rss_mb = get_memory_ceiling_mb()
+    write_bars = os.environ.get('WRITE_BARS', 'true').lower() == 'true'
 
-    today = datetime.now(pytz.timezone('Asia/Kolkata'))
+    tz = pytz.timezone('Asia/Kolkata')
+    # Wall clock and monotonic clock read together; request times are derived from it
+    anchor = wall_clock_anchor(tz)
+    today = datetime.now(tz)
     today_str = today.strftime('%Y-%m-%d')
 
     # Get market status
     market_status = get_market_status()
     print(f"Current time: {market_status['current_time']} (IST)")
     print(f"Market hours: {market_status['market_open']} - {market_status['market_close']} IST")
-    print(f"Config -> WRITE_CSV={write_csv}, WRITE_DB={write_db}, OVERRIDE_MARKET_HOURS={override_hours}, TABLE={table_name}")
+    print(f"Config -> WRITE_CSV={write_csv}, WRITE_DB={write_db}, OVERRIDE_MARKET_HOURS={override_hours}, "
+          f"TABLE={table_name}, DEDUP_SNAPSHOTS={dedup_snapshots}, CHUNK_SIZE={chunk_size}, MAX_RSS_MB={max_rss_mb}, "
+          f"WRITE_BARS={write_bars}, CSV_SEGMENT_MINUTES={segment_minutes}")
 
     # Check if market is open
     if not override_hours and not is_market_hours():
@@ -256,7 +214,7 @@ def main():
         return
 
     ensure_output_dir()
-    timestamp = today.strftime('%Y-%m-%d %H:%M:%S')
+    snapshot_state = load_snapshot_state() if dedup_snapshots else {}
     engine: Optional[object] = None
     if write_db:
         try:
@@ -270,40 +228,120 @@ def main():
             notify_error("Database Connection Error", error_msg)
             write_db = False
 
+    if write_db:
+        # Tables created before the datetime columns existed need them added/converted
+        try:
+            migrate_option_chain_table(engine, table_name)
+        except SQLAlchemyError as e:
+            error_msg = str(e)
+            print(f"Failed to migrate table '{table_name}': {error_msg}")
+            notify_error("Database Migration Error", error_msg, f"Table: {table_name}")
+            write_db = False
+
+    aggregator = None
+    if write_bars and not (write_csv or write_db):
+        print("WRITE_CSV and WRITE_DB are both off. Skipping bars.")
+    elif write_bars:
+        try:
+            aggregator = BarAggregator(get_intervals())
+        except ValueError as e:
+            print(f"Invalid BAR_INTERVALS: {e}. Skipping bars.")
+            notify_error("Bar Config Error", str(e))
+
     for symbol in SYMBOLS:
+        # Decoding the payload is the big allocation, so check the ceiling before fetching
+        if memory_ceiling_hit(max_rss_mb, symbol, "before fetch"):
+            continue
         print(f"Fetching {symbol} option chain...")
-        oc_rows = []
         try:
-            all_options = fetch_all_option_chain(symbol)
-            for row in format_for_nautilus(all_options, symbol, EXCHANGE, timestamp):
-                oc_rows.append(row)
+            all_options = fetch_all_option_chain(symbol, anchor=anchor)
         except Exception as e:
             error_msg = str(e)
             print(f"Error fetching {symbol}: {error_msg}")
             notify_error("NSE API Error", error_msg, f"Symbol: {symbol}")
             continue
 
-        if oc_rows:
-            df = pd.DataFrame(oc_rows)
-            if write_csv:
-                out_path = os.path.join(OUTPUT_DIR, f"{symbol}_{today_str}.csv")
-                if os.path.exists(out_path):
-                    df.to_csv(out_path, mode='a', header=False, index=False)
-                else:
-                    df.to_csv(out_path, index=False)
-                print(f"Saved {len(oc_rows)} rows to {out_path}")
-
-            # Save to RDS if configured
-            if write_db and engine is not None:
-                try:
-                    df.to_sql(table_name, con=engine, if_exists='append', index=False, method='multi', chunksize=1000)
-                    print(f"Inserted {len(df)} rows into database table '{table_name}'")
-                except SQLAlchemyError as db_err:
-                    error_msg = str(db_err)
-                    print(f"Database write failed: {error_msg}")
-                    notify_error("Database Write Error", error_msg, f"Symbol: {symbol}, Table: {table_name}")
-        else:
+        server_timestamp = all_options.get('timestamp')
+        server_key = server_timestamp.isoformat() if server_timestamp is not None else None
+        if dedup_snapshots and server_key is not None and snapshot_state.get(symbol) == server_key:
+            print(f"{symbol} snapshot unchanged (server time {server_key}). Skipping.")
+            continue
+
+        # Check again before anything is written: aborting mid-snapshot would leave a
+        # partial snapshot in the sinks that the next tick then ingests again in full.
+        if memory_ceiling_hit(max_rss_mb, symbol, "snapshot, nothing written"):
+            del all_options
+            continue
+
+        out_path = csv_segment_path(symbol, all_options['request_end'], segment_minutes)
+        # Stamp rows with when this symbol's data actually arrived, not when the run started.
+        # Raw entries are released as they are converted, so payload and rows never coexist in full.
+        rows = iter_nautilus_rows(all_options, symbol, EXCHANGE, all_options['request_end'], release=True)
+        csv_rows = db_rows = 0
+        db_error = None
+        try:
+            with ExitStack() as stack:
+                conn = None
+                if write_db and engine is not None:
+                    try:
+                        # One transaction per symbol, so a snapshot is stored whole or not at all
+                        conn = stack.enter_context(engine.begin())
+                    except SQLAlchemyError as e:
+                        db_error = e
+                for chunk in chunked(rows, chunk_size):
+                    df = rows_to_frame(chunk)
+                    if aggregator is not None:
+                        aggregator.update(df)
+                    if write_csv:
+                        write_csv_chunk(df, out_path)
+                        csv_rows += len(df)
+
+                    # Save to RDS if configured
+                    if conn is not None and db_error is None:
+                        try:
+                            df.to_sql(table_name, con=conn, if_exists='append', index=False, method='multi',
+                                      chunksize=1000, dtype=datetime_dtypes())
+                            db_rows += len(df)
+                        except SQLAlchemyError as e:
+                            db_error = e
+                if db_error is not None:
+                    # Re-raise inside the transaction so the chunks already sent are rolled back
+                    raise db_error
+        except SQLAlchemyError as e:
+            db_error = e
+        finally:
+            del rows, all_options
+
+        if db_error is not None:
+            db_rows = 0
+            error_msg = str(db_error)
+            print(f"Database write failed, {symbol} snapshot not stored: {error_msg}")
+            notify_error("Database Write Error", error_msg, f"Symbol: {symbol}, Table: {table_name}")
+        if csv_rows:
+            print(f"Saved {csv_rows} rows to {out_path}")
+        if db_rows:
+            print(f"Inserted {db_rows} rows into database table '{table_name}'")
+        if not csv_rows and not db_rows and db_error is None:
             print(f"No data for {symbol}")
+        elif dedup_snapshots and server_key is not None and db_error is None:
+            # Only mark the snapshot ingested once every enabled sink has it, so a failed
+            # sink gets it again on the next tick instead of losing it for good
+            snapshot_state[symbol] = server_key
+            save_snapshot_state(snapshot_state)
+        print(f"{symbol} memory: {format_memory_report()}")
+
+    if aggregator is not None:
+        # Close the day's last bars now instead of on the next trading day's first snapshot
+        if today.time() >= MARKET_CLOSE:
+            aggregator.flush()
+        try:
+            aggregator.save(write_csv=write_csv, engine=engine if write_db else None)
+        except SQLAlchemyError as db_err:
+            error_msg = str(db_err)
+            print(f"Bar database write failed: {error_msg}")
+            notify_error("Database Write Error", error_msg, f"Bars: {bar_table_name('*')}")
+
+    print(f"Tick complete. {format_memory_report()}")
 
 
 if __name__ == '__main__':
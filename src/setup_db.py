@@ -4,6 +4,11 @@ import csv
 import pymysql
 import argparse
 
+# Ensure local imports work when run as a module/script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db import DATETIME_COLUMNS
+
 
 def env(name: str, default: str = "") -> str:
     v = os.environ.get(name, default)
@@ -77,7 +82,12 @@ def create_database_and_user(args):
                 if not headers:
                     print(f"No headers found in CSV {csv_schema_path}; skipping table creation.")
                 else:
-                    col_defs = ", ".join([f"`{h}` VARCHAR(255)" for h in headers])
+                    # Datetime columns keep microseconds; add any the CSV predates
+                    headers += [c for c in DATETIME_COLUMNS if c not in headers]
+                    col_defs = ", ".join([
+                        f"`{h}` DATETIME(6)" if h in DATETIME_COLUMNS else f"`{h}` VARCHAR(255)"
+                        for h in headers
+                    ])
                     cur.execute(f"CREATE TABLE IF NOT EXISTS `{db_name}`.`{table_name}` ({col_defs});")
                     print(f"Table ensured: {db_name}.{table_name}")
             else:
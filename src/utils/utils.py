@@ -1,5 +1,6 @@
 from config.nse_holidays import NSE_HOLIDAYS_2024
 from datetime import datetime, time
+from itertools import islice
 import pytz
 
 def is_nse_holiday(date_str):
@@ -47,4 +48,15 @@ def get_market_status():
         'market_close': '15:30:00'
     }
     
-    return status 
\ No newline at end of file
+    return status
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from `iterable` without materializing it."""
+    if size <= 0:
+        raise ValueError("chunk size must be positive")
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
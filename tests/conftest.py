@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import modules as `src.<module>` the same way the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,84 @@
+import json
+
+from src.alerts import AlertDispatcher, FileBackend
+
+
+def _dispatcher(tmp_path, rate_limit=900, digest_window=0.2):
+    backend = FileBackend(str(tmp_path / 'alerts.log'))
+    return AlertDispatcher([backend], rate_limit=rate_limit, digest_window=digest_window,
+                           state_file=str(tmp_path / 'state.json'))
+
+
+def _messages(tmp_path):
+    path = tmp_path / 'alerts.log'
+    if not path.exists():
+        return []
+    return [m for m in path.read_text(encoding='utf-8').split('----- ') if m]
+
+
+def test_single_alert_is_flushed_on_close(tmp_path):
+    d = _dispatcher(tmp_path, digest_window=60)
+    d.notify('NSE API Error', 'timeout', 'Symbol: NIFTY')
+    d.close()  # must not wait for the 60s digest window
+
+    messages = _messages(tmp_path)
+    assert len(messages) == 1
+    assert 'DataScraper Error\n' in messages[0]
+    assert 'Context: Symbol: NIFTY' in messages[0]
+    assert 'Error: timeout' in messages[0]
+
+
+def test_burst_is_coalesced_and_identical_alerts_deduped(tmp_path):
+    d = _dispatcher(tmp_path)
+    d.notify('NSE API Error', 'timeout', 'Symbol: NIFTY')
+    d.notify('NSE API Error', 'timeout', 'Symbol: BANKNIFTY')
+    d.notify('Database Write Error', 'deadlock', 'Symbol: NIFTY')
+    d.notify('Database Write Error', 'disk full', 'Symbol: BANKNIFTY')
+    d.close()
+
+    messages = _messages(tmp_path)
+    assert len(messages) == 1
+    digest = messages[0]
+    assert 'Digest (4 alerts)' in digest
+    assert 'Type: NSE API Error (x2)' in digest
+    assert 'Context: Symbol: NIFTY; Symbol: BANKNIFTY' in digest
+    # Different messages of the same type are both kept
+    assert 'Error: deadlock' in digest
+    assert 'Error: disk full' in digest
+
+
+def test_rate_limit_persists_across_dispatchers(tmp_path):
+    d = _dispatcher(tmp_path)
+    d.notify('NSE API Error', 'timeout')
+    d.close()
+
+    # A later cron run: same type is held back and counted
+    d = _dispatcher(tmp_path)
+    d.notify('NSE API Error', 'timeout')
+    d.notify('NSE API Error', 'timeout')
+    d.close()
+    assert len(_messages(tmp_path)) == 1
+    state = json.loads((tmp_path / 'state.json').read_text())
+    assert state['NSE API Error']['suppressed'] == 2
+
+    # Once the limit has passed, the suppressed count is reported and reset
+    d = _dispatcher(tmp_path, rate_limit=0)
+    d.notify('NSE API Error', 'timeout')
+    d.close()
+    messages = _messages(tmp_path)
+    assert len(messages) == 2
+    assert 'Suppressed since last alert: 2' in messages[1]
+    state = json.loads((tmp_path / 'state.json').read_text())
+    assert state['NSE API Error']['suppressed'] == 0
+
+
+def test_other_types_not_rate_limited(tmp_path):
+    d = _dispatcher(tmp_path)
+    d.notify('NSE API Error', 'timeout')
+    d.close()
+    d = _dispatcher(tmp_path)
+    d.notify('Database Write Error', 'deadlock')
+    d.close()
+    messages = _messages(tmp_path)
+    assert len(messages) == 2
+    assert 'Type: Database Write Error' in messages[1]
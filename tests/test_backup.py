@@ -0,0 +1,145 @@
+import gzip
+import os
+import threading
+
+import pytest
+
+import src.backup as backup
+from src.backup import LocalDirRemote, run_backup
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    source = tmp_path / 'daily'
+    source.mkdir()
+    return {
+        'source': source,
+        'remote_dir': tmp_path / 'remote',
+        'kwargs': dict(manifest_path=str(tmp_path / 'manifest.json'), staging_dir=str(tmp_path / 'staging'),
+                       quiet_seconds=0, workers=2),
+    }
+
+
+def _run(ws, remote=None, **kwargs):
+    remote = remote or LocalDirRemote(str(ws['remote_dir']))
+    return run_backup([str(ws['source'])], remote, **ws['kwargs'], **kwargs)
+
+
+def _remote_text(ws, name):
+    with gzip.open(ws['remote_dir'] / 'daily' / f'{name}.gz', 'rt') as f:
+        return f.read()
+
+
+def test_uploads_compressed_and_skips_by_manifest(workspace):
+    (workspace['source'] / 'NIFTY_2025-10-16.csv').write_text("a,b\n1,2\n")
+    (workspace['source'] / 'BANKNIFTY_2025-10-16.csv').write_text("a,b\n3,4\n")
+
+    first = _run(workspace)
+    assert first['uploaded'] == 2 and not first['failed']
+    assert _remote_text(workspace, 'NIFTY_2025-10-16.csv') == "a,b\n1,2\n"
+
+    second = _run(workspace)
+    assert second['uploaded'] == 0
+    assert second['skipped'] == 2
+
+
+def test_changed_file_is_uploaded_again(workspace):
+    path = workspace['source'] / 'NIFTY_2025-10-16.csv'
+    path.write_text("a,b\n1,2\n")
+    _run(workspace)
+
+    path.write_text("a,b\n1,2\n5,6\n")
+    result = _run(workspace)
+    assert result['uploaded'] == 1
+    assert _remote_text(workspace, 'NIFTY_2025-10-16.csv') == "a,b\n1,2\n5,6\n"
+
+
+class FlakyRemote(LocalDirRemote):
+    def __init__(self, root, failures):
+        super().__init__(root)
+        self.failures = failures
+        self.calls = 0
+
+    def upload(self, local_path, remote_name):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise IOError("connection reset")
+        super().upload(local_path, remote_name)
+
+
+def test_upload_is_retried(workspace, monkeypatch):
+    monkeypatch.setattr(backup.time, 'sleep', lambda seconds: None)
+    (workspace['source'] / 'NIFTY_2025-10-16.csv').write_text("a,b\n1,2\n")
+
+    remote = FlakyRemote(str(workspace['remote_dir']), failures=2)
+    result = _run(workspace, remote=remote, retries=3)
+    assert result['uploaded'] == 1 and remote.calls == 3
+
+    # Exhausted retries: reported as failed and not recorded, so the next run retries it
+    (workspace['source'] / 'BANKNIFTY_2025-10-16.csv').write_text("a,b\n3,4\n")
+    remote = FlakyRemote(str(workspace['remote_dir']), failures=5)
+    result = _run(workspace, remote=remote, retries=2)
+    assert len(result['failed']) == 1
+    assert _run(workspace)['uploaded'] == 1
+
+
+def test_delete_source_covers_files_uploaded_in_earlier_runs(workspace):
+    old = workspace['source'] / 'NIFTY_2025-10-16.csv'
+    old.write_text("a,b\n1,2\n")
+    today = backup.datetime.now(backup.pytz.timezone('Asia/Kolkata')).strftime('%Y-%m-%d')
+    current = workspace['source'] / f'NIFTY_{today}.csv'
+    current.write_text("a,b\n1,2\n")
+    _run(workspace)
+
+    result = _run(workspace, delete_source=True)
+    assert result['deleted'] == 1
+    assert not old.exists()
+    # Today's file may still be appended to
+    assert current.exists()
+
+
+def test_delete_source_keeps_files_not_backed_up(workspace, monkeypatch):
+    monkeypatch.setattr(backup.time, 'sleep', lambda seconds: None)
+    path = workspace['source'] / 'NIFTY_2025-10-16.csv'
+    path.write_text("a,b\n1,2\n")
+    remote = FlakyRemote(str(workspace['remote_dir']), failures=5)
+
+    result = _run(workspace, remote=remote, retries=1, delete_source=True)
+    assert result['deleted'] == 0
+    assert os.path.exists(path)
+
+
+def test_manifest_keys_ignore_source_spelling(workspace, monkeypatch):
+    (workspace['source'] / 'NIFTY_2025-10-16.csv').write_text("a,b\n1,2\n")
+    _run(workspace)
+
+    monkeypatch.chdir(workspace['source'].parent)
+    remote = LocalDirRemote(str(workspace['remote_dir']))
+    result = run_backup(['daily/'], remote, **workspace['kwargs'])
+    assert result['uploaded'] == 0 and result['skipped'] == 1
+
+
+def test_new_remote_uploads_again_and_keeps_source(workspace, tmp_path):
+    path = workspace['source'] / 'NIFTY_2025-10-16.csv'
+    path.write_text("a,b\n1,2\n")
+    _run(workspace)
+
+    other = FlakyRemote(str(tmp_path / 'other'), failures=99)
+    result = _run(workspace, remote=other, delete_source=True, retries=1)
+    # Not backed up to the new remote, so it must not be deleted
+    assert len(result['failed']) == 1
+    assert path.exists()
+
+
+def test_overlapping_run_waits_for_lock(workspace):
+    (workspace['source'] / 'NIFTY_2025-10-16.csv').write_text("a,b\n1,2\n")
+    lock_path = backup.lock_file_for(workspace['kwargs']['manifest_path'])
+    finished = threading.Event()
+
+    with backup.RunLock(lock_path):
+        worker = threading.Thread(target=lambda: (_run(workspace), finished.set()))
+        worker.start()
+        assert not finished.wait(0.5)
+    worker.join(10)
+    assert finished.is_set()
+    assert _remote_text(workspace, 'NIFTY_2025-10-16.csv') == "a,b\n1,2\n"
@@ -0,0 +1,135 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.bars import BarAggregator, backfill_from_csv, backfill_from_db
+
+CONTRACT = 'NIFTY.NSE.OPT.30Oct2025.24000.CALL'
+
+
+def _row(ts, last, volume, oi, contract=CONTRACT):
+    return {
+        'server_timestamp': ts, 'symbol': contract, 'underlying': 'NIFTY', 'option_type': 'CALL',
+        'strike': 24000, 'expiry': '30-Oct-2025', 'last': last, 'volume': volume, 'open_interest': oi,
+    }
+
+
+def _bars(tmp_path, interval='1min'):
+    path = tmp_path / 'bars' / f'NIFTY_2025-10-17_{interval}.csv'
+    return pd.read_csv(path, parse_dates=['bar_start'])
+
+
+def test_ohlc_volume_delta_and_oi_change_across_roll(tmp_path):
+    agg = BarAggregator(['1min'], state_file=None)
+    agg.update([
+        _row(datetime(2025, 10, 17, 10, 0, 5), 10.0, 100, 1000),
+        _row(datetime(2025, 10, 17, 10, 0, 30), 14.0, 150, 1100),
+        _row(datetime(2025, 10, 17, 10, 0, 55), 8.0, 170, 1080),
+    ])
+    # Nothing closes until a later bucket is seen
+    assert agg.pop_closed('1min').empty
+    agg.update([_row(datetime(2025, 10, 17, 10, 1, 5), 9.0, 200, 1050)])
+
+    bars = agg.pop_closed('1min')
+    assert len(bars) == 1
+    bar = bars.iloc[0]
+    assert bar['bar_start'] == datetime(2025, 10, 17, 10, 0)
+    assert (bar['open'], bar['high'], bar['low'], bar['close']) == (10.0, 14.0, 8.0, 8.0)
+    # First snapshot of the day carries its full cumulative volume
+    assert bar['volume'] == 170
+    assert bar['vwap'] == (10.0 * 100 + 14.0 * 50 + 8.0 * 20) / 170
+    assert (bar['oi_open'], bar['oi_close'], bar['oi_change']) == (1000, 1080, 80)
+
+    agg.flush()
+    second = agg.pop_closed('1min').iloc[0]
+    assert second['volume'] == 30
+    # OI change is measured from the previous bar's close
+    assert second['oi_change'] == 1050 - 1080
+
+
+def test_state_reload_continues_open_bar(tmp_path):
+    state_file = str(tmp_path / 'bars' / '.state.json')
+    first = BarAggregator(['1min'], state_file=state_file)
+    first.update([_row(datetime(2025, 10, 17, 10, 0, 5), 10.0, 100, 1000)])
+    assert first.save(bars_dir=str(tmp_path / 'bars')) == 0
+
+    # Next cron run: same bar continues, then rolls
+    second = BarAggregator(['1min'], state_file=state_file)
+    second.update([_row(datetime(2025, 10, 17, 10, 0, 40), 12.0, 130, 1010)])
+    second.update([_row(datetime(2025, 10, 17, 10, 1, 5), 11.0, 140, 1020)])
+    assert second.save(bars_dir=str(tmp_path / 'bars')) == 1
+
+    bar = _bars(tmp_path).iloc[0]
+    assert (bar['open'], bar['close'], bar['volume'], bar['snapshots']) == (10.0, 12.0, 130, 2)
+
+
+def test_state_prunes_contracts_from_previous_days(tmp_path):
+    state_file = str(tmp_path / '.state.json')
+    agg = BarAggregator(['1min'], state_file=state_file)
+    agg.update([_row(datetime(2025, 10, 16, 15, 29, 0), 10.0, 100, 1000, contract='OLD')])
+    agg.update([_row(datetime(2025, 10, 17, 9, 15, 0), 10.0, 100, 1000)])
+    agg.save(bars_dir=str(tmp_path / 'bars'))
+
+    assert set(BarAggregator(['1min'], state_file=state_file).last_seen) == {CONTRACT}
+
+
+def test_backfill_replaces_existing_bars(tmp_path):
+    snapshots = tmp_path / 'NIFTY_2025-10-17.csv'
+    pd.DataFrame([
+        _row('2025-10-17 10:00:05', 10.0, 100, 1000),
+        _row('2025-10-17 10:01:05', 11.0, 120, 1000),
+    ]).to_csv(snapshots, index=False)
+    engine = create_engine(f"sqlite:///{tmp_path / 'bars.db'}")
+
+    for _ in range(2):
+        agg = backfill_from_csv([str(snapshots)], ['1min'])
+        assert agg.save(bars_dir=str(tmp_path / 'bars'), engine=engine, replace=True) == 2
+
+    assert len(_bars(tmp_path)) == 2
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM option_bars_1min")).scalar() == 2
+
+
+def test_save_without_output_keeps_bars(tmp_path):
+    agg = BarAggregator(['1min'], state_file=None)
+    agg.update([_row(datetime(2025, 10, 17, 10, 0, 5), 10.0, 100, 1000)])
+    agg.flush()
+
+    assert agg.save(write_csv=False, bars_dir=str(tmp_path / 'bars')) == 0
+    assert not (tmp_path / 'bars').exists()
+    assert agg.save(bars_dir=str(tmp_path / 'bars')) == 1
+    assert len(_bars(tmp_path)) == 1
+
+
+def test_failed_db_only_save_is_retried_after_reload(tmp_path):
+    state_file = str(tmp_path / '.state.json')
+    agg = BarAggregator(['1min'], state_file=state_file)
+    agg.update([_row(datetime(2025, 10, 17, 10, 0, 5), 10.0, 100, 1000)])
+    agg.flush()
+    # A directory where the database file should be makes every connection fail
+    (tmp_path / 'down.db').mkdir()
+    with pytest.raises(SQLAlchemyError):
+        agg.save(write_csv=False, engine=create_engine(f"sqlite:///{tmp_path / 'down.db'}"))
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'bars.db'}")
+    assert BarAggregator(['1min'], state_file=state_file).save(write_csv=False, engine=engine) == 1
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT close FROM option_bars_1min")).scalar() == 10.0
+    assert BarAggregator(['1min'], state_file=state_file).save(write_csv=False, engine=engine) == 0
+
+
+def test_backfill_from_db_orders_by_server_time(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'oc.db'}")
+    rows = pd.DataFrame([
+        # Captured late but stamped earlier by NSE; must be aggregated first
+        dict(_row(datetime(2025, 10, 17, 10, 0, 5), 10.0, 100, 1000), timestamp=datetime(2025, 10, 17, 10, 2)),
+        dict(_row(datetime(2025, 10, 17, 10, 0, 50), 12.0, 130, 1000), timestamp=datetime(2025, 10, 17, 10, 1)),
+    ], index=[1, 0]).sort_index()
+    rows['extra'] = 'ignored'
+    rows.to_sql('option chain', con=engine, index=False)
+
+    bar = backfill_from_db(engine, 'option chain', ['1min']).pop_closed('1min').iloc[0]
+    assert (bar['open'], bar['close'], bar['volume']) == (10.0, 12.0, 130)
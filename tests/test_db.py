@@ -0,0 +1,41 @@
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+
+from src.db import DATETIME_COLUMNS, datetime_dtypes, migrate_option_chain_table
+from src.scrape import write_csv_chunk
+
+
+def test_migration_adds_datetime_columns_to_legacy_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'oc.db'}")
+    with engine.begin() as conn:
+        # Layout setup_db.py used to create from the old CSV header
+        conn.execute(text("CREATE TABLE option_chain (timestamp VARCHAR(255), symbol VARCHAR(255))"))
+
+    statements = migrate_option_chain_table(engine, 'option_chain')
+
+    assert len(statements) == 3
+    columns = {c['name'] for c in inspect(engine).get_columns('option_chain')}
+    assert set(DATETIME_COLUMNS) <= columns
+    df = pd.DataFrame([{col: pd.Timestamp('2025-10-17 10:00:00.123456') for col in DATETIME_COLUMNS}])
+    df['symbol'] = 'NIFTY.NSE.OPT.30Oct2025.24000.CALL'
+    df.to_sql('option_chain', con=engine, if_exists='append', index=False, dtype=datetime_dtypes())
+    # Second run is a no-op
+    assert migrate_option_chain_table(engine, 'option_chain') == []
+
+
+def test_migration_skips_missing_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'oc.db'}")
+    assert migrate_option_chain_table(engine, 'option_chain') == []
+
+
+def test_csv_rotates_when_header_changes(tmp_path):
+    out_path = tmp_path / 'NIFTY_2025-10-17.csv'
+    out_path.write_text("timestamp,symbol\n2025-10-17 10:00:00,OLD\n")
+
+    write_csv_chunk(pd.DataFrame([{'timestamp': 'x', 'server_timestamp': 'y', 'symbol': 'NEW'}]), str(out_path))
+    write_csv_chunk(pd.DataFrame([{'timestamp': 'x', 'server_timestamp': 'y', 'symbol': 'NEW2'}]), str(out_path))
+
+    assert (tmp_path / 'NIFTY_2025-10-17.1.csv').read_text().startswith("timestamp,symbol\n")
+    lines = out_path.read_text().splitlines()
+    assert lines[0] == "timestamp,server_timestamp,symbol"
+    assert len(lines) == 3
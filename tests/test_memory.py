@@ -0,0 +1,72 @@
+import pytest
+
+from src import memory
+from src.memory import MemoryCeilingExceeded, check_memory_ceiling, get_memory_ceiling_mb, format_memory_report
+from src.nse_scraper import format_for_nautilus, iter_nautilus_rows
+from src.utils.utils import chunked
+
+EXPIRY = '30-Oct-2025'
+
+
+def _chain(n):
+    data = []
+    for i in range(n):
+        leg = {'expiryDate': EXPIRY, 'strikePrice': 24000 + 50 * i, 'lastPrice': 1.0 + i, 'openInterest': i}
+        data.append({'strikePrice': 24000 + 50 * i, 'expiryDate': EXPIRY, 'CE': dict(leg), 'PE': dict(leg)})
+    return {'data': data, 'underlyingValue': 24100.0}
+
+
+def test_chunked():
+    assert [list(c) for c in chunked(range(7), 3)] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+    assert [len(c) for c in chunked(iter(range(6)), 2)] == [2, 2, 2]
+
+
+@pytest.mark.parametrize('size', [0, -1])
+def test_chunked_rejects_non_positive_size(size):
+    with pytest.raises(ValueError):
+        list(chunked(range(3), size))
+
+
+def test_iter_rows_with_release_matches_format_for_nautilus():
+    expected = format_for_nautilus(_chain(5), 'NIFTY', 'NSE', 'ts')
+
+    chain = _chain(5)
+    rows = iter_nautilus_rows(chain, 'NIFTY', 'NSE', 'ts', release=True)
+    first = next(rows)
+    # Entries are dropped as they are converted, not only at the end
+    assert chain['data'][0] is None and chain['data'][1] is not None
+    assert [first] + list(rows) == expected
+    assert chain['data'] == [None] * 5
+
+
+def test_iter_rows_without_release_keeps_payload():
+    chain = _chain(2)
+    list(iter_nautilus_rows(chain, 'NIFTY', 'NSE', 'ts'))
+    assert all(entry is not None for entry in chain['data'])
+
+
+@pytest.mark.parametrize('value, expected', [('', None), ('abc', None), ('0', None), ('-5', None), ('512', 512.0)])
+def test_get_memory_ceiling_mb(monkeypatch, value, expected):
+    monkeypatch.setenv('MAX_RSS_MB', value)
+    assert get_memory_ceiling_mb() == expected
+
+
+def test_check_memory_ceiling(monkeypatch):
+    monkeypatch.setattr(memory, 'current_rss_mb', lambda: 300.0)
+    check_memory_ceiling(None)
+    check_memory_ceiling(400)
+    with pytest.raises(MemoryCeilingExceeded, match='300.0 MB exceeds ceiling of 200.0 MB'):
+        check_memory_ceiling(200)
+
+
+def test_check_memory_ceiling_collects_garbage_first(monkeypatch):
+    readings = iter([300.0, 150.0])
+    monkeypatch.setattr(memory, 'current_rss_mb', lambda: next(readings))
+    check_memory_ceiling(200)
+
+
+def test_memory_report_peak_never_below_current(monkeypatch):
+    monkeypatch.setattr(memory, 'current_rss_mb', lambda: 94.3)
+    monkeypatch.setattr(memory, 'peak_rss_mb', lambda: 94.1)
+    assert format_memory_report() == "RSS 94.3 MB, peak RSS 94.3 MB"
@@ -0,0 +1,50 @@
+import math
+
+from src.oc_matrix import OC_COLS, build_oc_matrices, matrix_to_frame, render_matrix
+
+EXPIRY = '30-Oct-2025'
+
+
+def _leg(base):
+    return {
+        'expiryDate': EXPIRY, 'strikePrice': 24000,
+        'openInterest': base + 1, 'changeinOpenInterest': base + 2, 'totalTradedVolume': base + 3,
+        'impliedVolatility': base + 4, 'lastPrice': base + 5, 'change': base + 6,
+        'bidQty': base + 7, 'bidprice': base + 8, 'askPrice': base + 9, 'askQty': base + 10,
+    }
+
+
+def _chain(with_pe=True):
+    entry = {'strikePrice': 24000, 'expiryDate': EXPIRY, 'CE': _leg(100)}
+    if with_pe:
+        entry['PE'] = _leg(200)
+    return {'data': [entry], 'expiry_dates': [EXPIRY]}
+
+
+def test_columns_follow_oc_cols_on_both_sides():
+    row = dict(zip(OC_COLS, build_oc_matrices(_chain())[EXPIRY]['values'][0]))
+
+    expected_offsets = {
+        'OI': 1, 'CHNG_IN_OI': 2, 'VOLUME': 3, 'IV': 4, 'LTP': 5, 'CHNG': 6,
+        'BID_QTY': 7, 'BID': 8, 'ASK': 9, 'ASK_QTY': 10,
+    }
+    for suffix, offset in expected_offsets.items():
+        assert row[f'c_{suffix}'] == 100 + offset, suffix
+        assert row[f'p_{suffix}'] == 200 + offset, suffix
+    assert row['STRIKE'] == 24000
+
+
+def test_missing_leg_is_masked_and_input_untouched():
+    chain = _chain(with_pe=False)
+    before = repr(chain)
+    matrix = build_oc_matrices(chain)[EXPIRY]
+
+    assert repr(chain) == before
+    pe_idx = [i for i, col in enumerate(OC_COLS) if col.startswith('p_')]
+    assert not matrix['mask'][0, pe_idx].any()
+    assert all(math.isnan(v) for v in matrix['values'][0, pe_idx])
+
+    df = matrix_to_frame(matrix)
+    assert str(df['c_OI'].dtype) == 'Int64'
+    assert df['p_OI'].isna().all()
+    assert render_matrix(matrix).splitlines()[1].split()[-1] == '-'
@@ -0,0 +1,166 @@
+from datetime import datetime, time as dtime
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from src import scrape
+from src.memory import MemoryCeilingExceeded
+
+EXPIRY = '30-Oct-2025'
+
+
+def _chain(server_time, strikes=(24000, 24100)):
+    data = []
+    for strike in strikes:
+        leg = {'expiryDate': EXPIRY, 'strikePrice': strike, 'lastPrice': 10.0, 'totalTradedVolume': 5,
+               'openInterest': 100, 'bidprice': 9.5, 'askPrice': 10.5}
+        data.append({'strikePrice': strike, 'expiryDate': EXPIRY, 'CE': dict(leg), 'PE': dict(leg)})
+    return {
+        'data': data, 'expiry_dates': [EXPIRY], 'underlyingValue': 24050.0,
+        'timestamp': server_time,
+        'request_start': datetime(2025, 10, 17, 10, 0, 0, 100000),
+        'request_end': datetime(2025, 10, 17, 10, 0, 0, 400000),
+    }
+
+
+@pytest.fixture
+def scraper(tmp_path, monkeypatch):
+    """Run scrape.main() in tmp_path with CSV output only and a fake NSE fetch."""
+    monkeypatch.chdir(tmp_path)
+    for key, value in {'OVERRIDE_MARKET_HOURS': 'true', 'WRITE_DB': 'false', 'WRITE_BARS': 'false'}.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.delenv('MAX_RSS_MB', raising=False)
+    monkeypatch.setattr(scrape, 'SYMBOLS', ['NIFTY'])
+    alerts = []
+    monkeypatch.setattr(scrape, 'notify_error', lambda *args: alerts.append(args))
+    fetched = {'server_time': datetime(2025, 10, 17, 10, 0, 0)}
+    monkeypatch.setattr(scrape, 'fetch_all_option_chain',
+                        lambda symbol, anchor=None: _chain(fetched['server_time']))
+
+    def run():
+        scrape.main()
+        paths = sorted((tmp_path / 'data' / 'daily').glob('NIFTY_*.csv'))
+        return pd.concat([pd.read_csv(p) for p in paths]) if paths else pd.DataFrame()
+
+    run.fetched = fetched
+    run.alerts = alerts
+    return run
+
+
+def test_unchanged_snapshot_is_skipped(scraper):
+    assert len(scraper()) == 4
+    assert scrape.load_snapshot_state() == {'NIFTY': '2025-10-17T10:00:00'}
+
+    # Same server timestamp on the next tick: nothing new is written
+    assert len(scraper()) == 4
+
+    scraper.fetched['server_time'] = datetime(2025, 10, 17, 10, 0, 3)
+    df = scraper()
+    assert len(df) == 8
+    assert scrape.load_snapshot_state() == {'NIFTY': '2025-10-17T10:00:03'}
+
+
+def test_dedup_can_be_disabled(scraper, monkeypatch):
+    monkeypatch.setenv('DEDUP_SNAPSHOTS', 'false')
+    scraper()
+    assert len(scraper()) == 8
+
+
+def test_symbol_skipped_before_fetch_when_over_ceiling(scraper, monkeypatch):
+    monkeypatch.setenv('MAX_RSS_MB', '100')
+    monkeypatch.setattr(scrape, 'check_memory_ceiling', _raise_ceiling)
+    monkeypatch.setattr(scrape, 'fetch_all_option_chain', _fail_fetch)
+
+    assert scraper().empty
+    assert [a[0] for a in scraper.alerts] == ['Memory Ceiling Exceeded']
+    assert scrape.load_snapshot_state() == {}
+
+
+def test_snapshot_skipped_when_fetch_crosses_ceiling(scraper, monkeypatch):
+    monkeypatch.setenv('MAX_RSS_MB', '100')
+    checks = []
+
+    def check(ceiling):
+        checks.append(ceiling)
+        if len(checks) > 1:
+            _raise_ceiling(ceiling)
+
+    monkeypatch.setattr(scrape, 'check_memory_ceiling', check)
+    assert scraper().empty
+    assert checks == [100.0, 100.0]
+    assert 'nothing written' in scraper.alerts[0][1]
+    assert scrape.load_snapshot_state() == {}
+
+
+def test_failed_db_chunk_rolls_back_whole_snapshot(scraper, monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'oc.db'}")
+    monkeypatch.setenv('WRITE_DB', 'true')
+    monkeypatch.setenv('CHUNK_SIZE', '3')
+    monkeypatch.setattr(scrape, 'get_engine', lambda: engine)
+    scraper()
+    assert _count(engine) == 4
+
+    calls = []
+    to_sql = pd.DataFrame.to_sql
+
+    def flaky_to_sql(self, *args, **kwargs):
+        calls.append(len(self))
+        if len(calls) == 2:
+            raise OperationalError('INSERT', {}, Exception('connection lost'))
+        return to_sql(self, *args, **kwargs)
+
+    monkeypatch.setattr(pd.DataFrame, 'to_sql', flaky_to_sql)
+    scraper.fetched['server_time'] = datetime(2025, 10, 17, 10, 0, 3)
+    scraper()
+    # The first chunk of the new snapshot was rolled back with the failed one
+    assert _count(engine) == 4
+    assert scraper.alerts[-1][0] == 'Database Write Error'
+    # Not marked as ingested, so the next tick stores it
+    assert scrape.load_snapshot_state() == {'NIFTY': '2025-10-17T10:00:00'}
+
+    monkeypatch.setattr(pd.DataFrame, 'to_sql', to_sql)
+    scraper()
+    assert _count(engine) == 8
+    assert scrape.load_snapshot_state() == {'NIFTY': '2025-10-17T10:00:03'}
+
+
+def _raise_ceiling(ceiling):
+    raise MemoryCeilingExceeded(f"RSS 150.0 MB exceeds ceiling of {ceiling:.1f} MB")
+
+
+def _fail_fetch(*args, **kwargs):
+    raise AssertionError("fetched despite the memory ceiling")
+
+
+def _count(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM option_chain")).scalar()
+
+
+def test_bars_flushed_at_market_close(scraper, monkeypatch, tmp_path):
+    monkeypatch.setenv('WRITE_BARS', 'true')
+    monkeypatch.setattr(scrape, 'MARKET_CLOSE', dtime(0, 0))
+    scraper()
+    bars = pd.read_csv(tmp_path / 'data' / 'bars' / 'NIFTY_2025-10-17_1min.csv')
+    assert len(bars) == 4
+
+
+def test_no_bars_without_an_output(scraper, monkeypatch, tmp_path):
+    monkeypatch.setenv('WRITE_BARS', 'true')
+    monkeypatch.setenv('WRITE_CSV', 'false')
+    scraper()
+    assert not (tmp_path / 'data' / 'bars').exists()
+
+
+def test_csv_segment_path():
+    captured_at = datetime(2025, 10, 17, 10, 59, 59)
+    assert scrape.csv_segment_path('NIFTY', captured_at, 60).endswith('NIFTY_2025-10-17_1000.csv')
+    assert scrape.csv_segment_path('NIFTY', captured_at, 15).endswith('NIFTY_2025-10-17_1045.csv')
+    assert scrape.csv_segment_path('NIFTY', captured_at, 0).endswith('NIFTY_2025-10-17.csv')
+
+
+def test_rows_written_to_hourly_segment(scraper, tmp_path):
+    scraper()
+    assert [p.name for p in (tmp_path / 'data' / 'daily').glob('*.csv')] == ['NIFTY_2025-10-17_1000.csv']
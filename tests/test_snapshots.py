@@ -0,0 +1,48 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+from src.nse_scraper import parse_nse_timestamp, wall_clock_anchor, monotonic_to_wall
+from src.scrape import load_snapshot_state, save_snapshot_state
+
+
+def test_parse_nse_timestamp():
+    assert parse_nse_timestamp('17-Oct-2025 15:30:00') == datetime(2025, 10, 17, 15, 30, 0)
+    assert parse_nse_timestamp(' 17-Oct-2025 09:15:01 ') == datetime(2025, 10, 17, 9, 15, 1)
+
+
+def test_parse_nse_timestamp_empty_or_malformed():
+    assert parse_nse_timestamp(None) is None
+    assert parse_nse_timestamp('') is None
+    assert parse_nse_timestamp('2025-10-17 15:30:00') is None
+    assert parse_nse_timestamp('17-Oct-2025') is None
+    assert parse_nse_timestamp(12345) is None
+
+
+def test_monotonic_to_wall():
+    anchor = (datetime(2025, 10, 17, 10, 0, 0), 1_000_000_000)
+    assert monotonic_to_wall(anchor, 1_000_000_000) == datetime(2025, 10, 17, 10, 0, 0)
+    assert monotonic_to_wall(anchor, 2_500_250_000) == datetime(2025, 10, 17, 10, 0, 1, 500250)
+
+    wall, anchor_ns = live = wall_clock_anchor()
+    assert wall.tzinfo is None
+    later = monotonic_to_wall(live, time.monotonic_ns())
+    assert timedelta(0) <= later - wall < timedelta(seconds=5)
+
+
+def test_snapshot_state_round_trip(tmp_path):
+    path = str(tmp_path / 'state.json')
+    assert load_snapshot_state(path) == {}
+
+    state = {'NIFTY': '2025-10-17T15:30:00'}
+    save_snapshot_state(state, path)
+    assert load_snapshot_state(path) == state
+    assert not (tmp_path / 'state.json.tmp').exists()
+
+
+def test_snapshot_state_ignores_corrupt_file(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('{"NIFTY": ')
+    assert load_snapshot_state(str(path)) == {}
+    path.write_text(json.dumps(['not', 'a', 'dict']))
+    assert load_snapshot_state(str(path)) == {}